@@ -0,0 +1,637 @@
+"""Offline benchmarks for the trip planner: local OpenWeather/Gemini stubs and the harnesses that use them.
+
+Run from the repository root, e.g. `python bench.py bench -n 200 -c 16`; `python bench.py -h` lists the reports.
+"""
+from __future__ import annotations
+
+import argparse
+import http.server
+import importlib.util
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ps-1a.py")
+
+
+def load_app():
+    """The planner app, imported once as `trip_planner` (its file name isn't a valid module name)"""
+    if "trip_planner" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("trip_planner", APP_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["trip_planner"] = module
+        spec.loader.exec_module(module)
+    return sys.modules["trip_planner"]
+
+
+load_app()
+from trip_planner import (
+    HTTP_POOL_SIZE, IMPORT_MS, MONTHS, TRIP_PLAN_ERROR_TEXT, DestinationCatalog, Flight, GeoCache, LLMCache, LocalInventory,
+    PlanWarehouse, TripPlan, TripPlannerAgent, UpstreamLimiter, WeatherCache, configure_http_client, np,
+)
+
+
+# Offline benchmark
+BENCH_CITIES = ["Tokyo", "Paris", "London", "New York", "Udaipur", "Rome", "Bangkok", "Kyoto", "Lisbon", "Seoul"]
+
+
+class LatencyModel:
+    """Log-normal latency with a given median, plus an independent error rate"""
+    
+    def __init__(self, median_ms: float, sigma: float = 0.5, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    def sample(self) -> Tuple[float, bool]:
+        """(seconds to wait, whether this call fails)"""
+        with self._lock:
+            if self.median_ms <= 0:
+                delay = 0.0
+            else:
+                delay = self._rng.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+            return delay, self._rng.random() < self.error_rate
+
+
+class StubOpenWeather:
+    """Local stand-in for the OpenWeather geo, weather and forecast endpoints"""
+    
+    def __init__(self, latency: LatencyModel):
+        stub = self
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                delay, fail = stub.latency.sample()
+                time.sleep(delay)
+                path = urlsplit(self.path).path
+                if fail:
+                    self._send(503, {"cod": 503, "message": "stub failure"})
+                elif path == "/geo/1.0/direct":
+                    self._send(200, [{"lat": 35.0, "lon": 135.75}])
+                elif path == "/data/2.5/weather":
+                    self._send(200, stub.current())
+                elif path == "/data/2.5/forecast":
+                    self._send(200, stub.forecast())
+                else:
+                    self._send(404, {"cod": 404, "message": "not found"})
+            
+            def _send(self, status: int, payload: Any):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+    
+    @staticmethod
+    def current() -> Dict:
+        # Every field of a real current-weather response, so payload sizes are realistic
+        return {
+            "coord": {"lon": 135.75, "lat": 35.0},
+            "weather": [{"id": 802, "main": "Clouds", "description": "scattered clouds", "icon": "03d"}],
+            "base": "stations",
+            "main": {"temp": 21.4, "feels_like": 20.9, "temp_min": 19.8, "temp_max": 22.6, "pressure": 1014,
+                     "humidity": 58, "sea_level": 1014, "grnd_level": 1009},
+            "visibility": 10000,
+            "wind": {"speed": 3.6, "deg": 250, "gust": 5.1},
+            "clouds": {"all": 40},
+            "dt": 1715400000,
+            "sys": {"type": 2, "id": 2008189, "country": "JP", "sunrise": 1715370000, "sunset": 1715420000},
+            "timezone": 32400,
+            "id": 1857910,
+            "name": "Kyoto",
+            "cod": 200,
+        }
+    
+    @staticmethod
+    def forecast() -> Dict:
+        start = int(time.time()) // 10800 * 10800
+        return {
+            "city": {"timezone": 0},
+            "list": [
+                {
+                    "dt": start + i * 10800,
+                    "main": {"temp": 18 + 4 * math.sin(i / 8 * 2 * math.pi), "temp_min": 17.0, "temp_max": 23.0},
+                    "weather": [{"main": "Rain" if i % 5 == 0 else "Clear"}],
+                    **({"rain": {"3h": 0.8}} if i % 5 == 0 else {}),
+                }
+                for i in range(40)
+            ],
+        }
+    
+    def start(self) -> "StubOpenWeather":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _StubUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class _StubResponse:
+    def __init__(self, text: str, prompt: str):
+        self.text = text
+        self.usage_metadata = _StubUsage(len(prompt) // 4, len(text) // 4)
+
+
+class _StubStream:
+    def __init__(self, chunks: List[str], prompt: str, delay: float):
+        self._chunks = chunks
+        self._delay = delay
+        self.usage_metadata = _StubUsage(len(prompt) // 4, sum(len(chunk) for chunk in chunks) // 4)
+    
+    def __iter__(self):
+        for chunk in self._chunks:
+            time.sleep(self._delay / len(self._chunks))
+            yield _StubResponse(chunk, "")
+
+
+class StubGenerativeModel:
+    """Local stand-in for genai.GenerativeModel.generate_content"""
+    
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _reply(prompt: str) -> str:
+        match = re.search(r"(\d+)-day", prompt)
+        days = int(match.group(1)) if match else 3
+        if "JSON object" in prompt:
+            return json.dumps({
+                "city_description": "A stub city with a long and storied past.",
+                "days": [{"day": day, "morning": "Museum visit", "afternoon": "Old town walk", "evening": "Local dinner"}
+                         for day in range(1, days + 1)],
+            })
+        if "itinerary" in prompt:
+            return "".join(
+                f"**Day {day}:**\n- Morning: Museum visit\n- Afternoon: Old town walk\n- Evening: Local dinner\n\n"
+                for day in range(1, days + 1)
+            )
+        return "A stub city with a long and storied past, known for its architecture, food and festivals."
+    
+    def generate_content(self, prompt: str, stream: bool = False, request_options: Optional[Dict] = None):
+        with self._lock:
+            self.calls += 1
+        delay, fail = self.latency.sample()
+        if fail:
+            time.sleep(delay / 4)
+            raise RuntimeError("stub Gemini failure")
+        text = self._reply(prompt)
+        if stream:
+            words = text.split(" ")
+            chunks = [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+            return _StubStream(chunks, prompt, delay)
+        time.sleep(delay)
+        return _StubResponse(text, prompt)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _report_header() -> Dict[str, Any]:
+    """The fields every report starts with: which commit was measured, and when"""
+    return {"commit": _git_commit(), "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+
+
+def _emit_report(report: Dict[str, Any], path: Optional[str]):
+    """Print a report as JSON, also writing it to path if one was given"""
+    print(json.dumps(report, indent=2))
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def run_benchmark(requests_total: int = 50, concurrency: int = 8, weather: Optional[LatencyModel] = None,
+                  llm: Optional[LatencyModel] = None, parallel: bool = True, combined: bool = False,
+                  trace_memory: bool = False, seed: int = 7, gemini_rpm: float = 0) -> Dict[str, Any]:
+    """Drive plan_trip against the stubs with fresh caches and report latency, throughput and memory"""
+    try:
+        import resource
+    except ImportError:  # Unix only; peak RSS is left out elsewhere
+        resource = None
+    weather = weather or LatencyModel(80, seed=seed)
+    llm = llm or LatencyModel(1200, seed=seed + 1)
+    stub = StubOpenWeather(weather).start()
+    configure_http_client(pool_size=max(HTTP_POOL_SIZE, concurrency * 3), backoff_base=0.05)
+    agent = TripPlannerAgent(
+        "", "bench", parallel=parallel, combined=combined, weather_base_url=stub.url,
+        geo_cache=GeoCache(":memory:"), weather_cache=WeatherCache(), llm_cache=LLMCache(":memory:"),
+        gemini_limiter=UpstreamLimiter("bench_gemini", gemini_rpm, max_concurrency=concurrency * 4),
+        plan_warehouse=PlanWarehouse(":memory:")
+    )
+    model = agent.model = StubGenerativeModel(llm)
+    
+    rng = random.Random(seed)
+    workload = [(rng.choice(BENCH_CITIES), rng.randint(2, 7), rng.choice(MONTHS)) for _ in range(requests_total)]
+    
+    def timed_plan(city: str, duration: int, month: str) -> Tuple[float, TripPlan]:
+        started = time.perf_counter()
+        result = agent.plan_trip(city, duration, month)
+        return time.perf_counter() - started, result
+    
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    latencies, degraded = [], 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in as_completed([pool.submit(timed_plan, *request) for request in workload]):
+                elapsed, result = future.result()
+                latencies.append(elapsed)
+                if not result.weather.available or result.trip_plan == TRIP_PLAN_ERROR_TEXT or result.degraded:
+                    degraded += 1
+        wall = time.perf_counter() - started
+    finally:
+        peak_traced = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        stub.stop()
+    
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        **_report_header(),
+        "config": {
+            "requests": requests_total,
+            "concurrency": concurrency,
+            "parallel": parallel,
+            "combined": combined,
+            "gemini_rpm": gemini_rpm,
+            "weather_latency": {"median_ms": weather.median_ms, "sigma": weather.sigma, "error_rate": weather.error_rate},
+            "llm_latency": {"median_ms": llm.median_ms, "sigma": llm.sigma, "error_rate": llm.error_rate},
+        },
+        "results": {
+            "wall_s": round(wall, 3),
+            "throughput_rps": round(len(latencies) / wall, 2),
+            "latency_ms": {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1),
+                           "max": round(max(latencies) * 1000, 1)},
+            "degraded_plans": degraded,
+            "upstream_calls": {"openweather": stub.requests, "gemini": model.calls},
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+            "peak_traced_bytes": peak_traced,
+        },
+    }
+
+
+# Plan footprint benchmark
+def _legacy_plan_dict(plan: TripPlan, current: Dict) -> Dict[str, Any]:
+    """The nested-dict layout plan_trip returned before TripPlan, rebuilt from a plan and its raw weather"""
+    return {
+        "city_description": plan.city_description,
+        "weather": {"current": current, "daily": [day.to_dict() for day in plan.weather.daily],
+                    "coordinates": {"lat": current["coord"]["lat"], "lon": current["coord"]["lon"]}},
+        "climate": plan.climate,
+        "places": [{key: value for key, value in place.to_dict().items() if value is not None} for place in plan.places],
+        "flights": [{"airline": f.airline, "departure": f.departure, "arrival": f.arrival, "duration": f.duration_label,
+                     "price": f.price_label, "stops": f.stops_label} for f in plan.flights],
+        "hotels": [{"name": h.name, "rating": h.rating, "price_per_night": h.price_label, "amenities": list(h.amenities)}
+                   for h in plan.hotels],
+        "trip_plan": plan.trip_plan,
+        "itinerary_days": plan.itinerary_days,
+        "duration": plan.duration,
+        "month": plan.month,
+        "degraded": list(plan.degraded),
+    }
+
+
+def measure_footprint(plans: int = 200, rounds: int = 2000, city: str = "Paris", duration: int = 5,
+                      month: str = "May") -> Dict[str, Any]:
+    """Per-plan memory, encoded size and codec time of TripPlan against the old nested dicts"""
+    stub = StubOpenWeather(LatencyModel(0)).start()
+    try:
+        agent = TripPlannerAgent(
+            "", "footprint", weather_base_url=stub.url, deadline=0,
+            geo_cache=GeoCache(":memory:"), weather_cache=WeatherCache(), llm_cache=LLMCache(":memory:"),
+            plan_warehouse=PlanWarehouse(":memory:")
+        )
+        agent.model = StubGenerativeModel(LatencyModel(0))
+        plan = agent.plan_trip(city, duration, month)
+    finally:
+        stub.stop()
+    legacy = _legacy_plan_dict(plan, StubOpenWeather.current())
+    legacy_json = json.dumps(legacy, ensure_ascii=False).encode("utf-8")
+    packed = plan.pack()
+    
+    def retained(build: Callable[[], Any]) -> int:
+        # Bytes still allocated per plan while `plans` independent copies are alive
+        tracemalloc.start()
+        try:
+            copies = [build() for _ in range(plans)]
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del copies
+        return round(size / plans)
+    
+    def per_call_us(fn: Callable[[], Any]) -> float:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return round((time.perf_counter() - started) / rounds * 1e6, 1)
+    
+    memory = {
+        "legacy_dict": retained(lambda: json.loads(legacy_json)),
+        "trip_plan": retained(lambda: TripPlan.unpack(packed)),
+        "packed": retained(plan.pack),
+    }
+    size = {
+        "legacy_json": len(legacy_json),
+        "trip_plan_json": len(json.dumps(plan.to_dict(), ensure_ascii=False).encode("utf-8")),
+        "packed": len(packed),
+        "packed_zlib": len(zlib.compress(packed)),
+    }
+    return {
+        **_report_header(),
+        "plan": {"city": city, "duration": duration, "month": month, "copies": plans, "rounds": rounds},
+        "memory_bytes_per_plan": memory,
+        "size_bytes": size,
+        "encode_us": {"legacy_json": per_call_us(lambda: json.dumps(legacy, ensure_ascii=False)),
+                      "packed": per_call_us(plan.pack)},
+        "decode_us": {"legacy_json": per_call_us(lambda: json.loads(legacy_json)),
+                      "packed": per_call_us(lambda: TripPlan.unpack(packed))},
+        "reduction": {
+            "memory": round(1 - memory["trip_plan"] / memory["legacy_dict"], 3),
+            "memory_packed": round(1 - memory["packed"] / memory["legacy_dict"], 3),
+            "size": round(1 - size["packed"] / size["legacy_json"], 3),
+        },
+    }
+
+
+# Inventory search benchmark
+def synthetic_inventory(flights: int = 500_000, hotels: int = 200_000, routes: int = 2_000,
+                        seed: int = 7) -> LocalInventory:
+    """Random offers spread over many routes, using the shipped inventory's airlines and amenities"""
+    shipped = LocalInventory.load()
+    rng = np.random.default_rng(seed)
+    hubs = shipped.airports[:8]
+    airports = hubs + [f"A{index:04d}" for index in range(routes)]
+    flight_routes = rng.integers(0, routes, flights, dtype=np.int32)
+    hotel_routes = rng.integers(0, routes, hotels, dtype=np.int32)
+    amenity_bits = (rng.random((hotels, len(shipped.amenities))) < 0.4) @ (1 << np.arange(len(shipped.amenities)))
+    return LocalInventory(
+        [f"City {index}" for index in range(routes)], shipped.airlines, airports, shipped.amenities,
+        {
+            "route": flight_routes,
+            "price": (rng.lognormal(9.6, 0.45, flights) // 100 * 100).astype(np.int32),
+            "airline": rng.integers(0, len(shipped.airlines), flights, dtype=np.int16),
+            "departure": rng.integers(0, len(hubs), flights, dtype=np.int16),
+            "arrival": (len(hubs) + flight_routes).astype(np.int16),
+            "duration": rng.integers(60, 1500, flights, dtype=np.int16),
+            "stops": rng.choice(np.array([0, 1, 2], dtype=np.int8), flights, p=[0.5, 0.4, 0.1]),
+        },
+        {
+            "route": hotel_routes,
+            "price": (rng.lognormal(8.8, 0.6, hotels) // 100 * 100).astype(np.int32),
+            "rating": rng.integers(30, 51, hotels, dtype=np.int16),
+            "amenities": amenity_bits.astype(np.int64),
+        },
+        [f"Hotel {index}" for index in range(hotels)]
+    )
+
+
+def measure_inventory_search(flights: int = 500_000, hotels: int = 200_000, routes: int = 2_000,
+                             queries: int = 2_000, seed: int = 7) -> Dict[str, Any]:
+    """Latency of random filter-plus-top-k queries, checked against a full-column scan"""
+    started = time.perf_counter()
+    inventory = synthetic_inventory(flights, hotels, routes, seed)
+    build_s = time.perf_counter() - started
+    rng = random.Random(seed)
+    
+    def flight_query() -> Dict[str, Any]:
+        return {"destination": f"City {rng.randrange(routes)}", "origin": rng.choice([None, *inventory.airports[:8]]),
+                "max_price": rng.choice([None, 12000, 20000]), "max_stops": rng.choice([None, 0, 1]),
+                "max_duration": rng.choice([None, 600]), "sort": rng.choice(["price", "duration"]), "limit": 5}
+    
+    def hotel_query() -> Dict[str, Any]:
+        return {"city": f"City {rng.randrange(routes)}", "max_price": rng.choice([None, 6000, 12000]),
+                "min_rating": rng.choice([None, 4.0, 4.5]), "amenities": rng.sample(inventory.amenities, rng.randint(0, 2)),
+                "sort": rng.choice(["price", "rating"]), "limit": 5}
+    
+    def scan_flights(destination: str, origin: Optional[str], max_price: Optional[int], max_stops: Optional[int],
+                     max_duration: Optional[int], sort: str, limit: int) -> List[Flight]:
+        # The same query over whole columns, with no route index or price order to lean on
+        columns = inventory.flights.columns
+        mask = flight_route == inventory._routes[DestinationCatalog.normalize(destination)]
+        if origin is not None:
+            mask &= columns["departure"] == inventory.airports.index(origin)
+        if max_price is not None:
+            mask &= flight_price <= max_price
+        if max_stops is not None:
+            mask &= columns["stops"] <= max_stops
+        if max_duration is not None:
+            mask &= columns["duration"] <= max_duration
+        rows = np.flatnonzero(mask)
+        keys = (flight_price[rows],) if sort == "price" else (flight_price[rows], columns["duration"][rows])
+        return [
+            Flight(inventory.airlines[columns["airline"][i]], inventory.airports[columns["departure"][i]],
+                   inventory.airports[columns["arrival"][i]], int(columns["duration"][i]), int(flight_price[i]),
+                   int(columns["stops"][i]))
+            for i in rows[np.lexsort(keys)][:limit]
+        ]
+    
+    flight_route = np.repeat(np.arange(routes, dtype=np.int32), np.diff(inventory.flights.bounds))
+    flight_price = inventory.flights.price
+    
+    def timed(search: Callable, query_of: Callable[[], Dict[str, Any]], count: int) -> Tuple[List[float], List]:
+        latencies, results = [], []
+        for _ in range(count):
+            query = query_of()
+            query_started = time.perf_counter()
+            result = search(**query)
+            latencies.append(time.perf_counter() - query_started)
+            results.append((query, result))
+        return latencies, results
+    
+    def summary(latencies: List[float]) -> Dict[str, float]:
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+                "max_ms": round(max(latencies) * 1000, 3), "queries_per_s": round(len(latencies) / sum(latencies))}
+    
+    flight_latencies, flight_results = timed(inventory.search_flights, flight_query, queries)
+    hotel_latencies, _ = timed(inventory.search_hotels, hotel_query, queries)
+    checked = flight_results[:min(200, queries)]
+    scan_latencies, mismatches = [], 0
+    for query, expected in checked:
+        scan_started = time.perf_counter()
+        scanned = scan_flights(**query)
+        scan_latencies.append(time.perf_counter() - scan_started)
+        mismatches += scanned != expected
+    return {
+        **_report_header(),
+        "config": {"flights": flights, "hotels": hotels, "routes": routes, "queries": queries, "seed": seed},
+        "build_s": round(build_s, 3),
+        "index_bytes": inventory.nbytes,
+        "flights": summary(flight_latencies),
+        "hotels": summary(hotel_latencies),
+        "flights_full_scan": {**summary(scan_latencies), "queries": len(checked), "mismatches": mismatches},
+    }
+
+
+# Startup measurement
+STARTUP_MODULES = ("streamlit", "google.generativeai", "requests", "numpy", "aiohttp")
+
+
+def startup_probe() -> Dict[str, Any]:
+    """Cold-start timings for this process: module import, agent setup and a first offline plan"""
+    at_import = [name for name in STARTUP_MODULES if name in sys.modules]
+    stub = StubOpenWeather(LatencyModel(0)).start()
+    try:
+        started = time.perf_counter()
+        # A key makes setup load and configure the Gemini SDK as a real worker would
+        agent = TripPlannerAgent(
+            "startup-probe", "startup-probe", weather_base_url=stub.url, deadline=0,
+            geo_cache=GeoCache(":memory:"), weather_cache=WeatherCache(), llm_cache=LLMCache(":memory:"),
+            plan_warehouse=PlanWarehouse(":memory:")
+        )
+        agent.model = StubGenerativeModel(LatencyModel(0))
+        init_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        agent.plan_trip("Paris", 3, "May")
+        first_plan_ms = (time.perf_counter() - started) * 1000
+    finally:
+        stub.stop()
+    return {
+        "import_ms": round(IMPORT_MS, 1),
+        "init_ms": round(init_ms, 1),
+        "first_plan_ms": round(first_plan_ms, 1),
+        "modules_at_import": at_import,
+        "modules_after_plan": [name for name in STARTUP_MODULES if name in sys.modules],
+    }
+
+
+def measure_startup(runs: int = 5) -> Dict[str, Any]:
+    """Run the probe in fresh interpreters and summarize worker startup latency"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "startup", "--probe"],
+            capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        # Interpreter launch to first plan done, as an autoscaler sees a new worker
+        sample["process_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        samples.append(sample)
+    
+    def summary(field: str) -> Dict[str, float]:
+        values = [sample[field] for sample in samples]
+        return {"p50": round(float(np.median(values)), 1), "max": max(values)}
+    
+    return {
+        **_report_header(),
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "process_ms": summary("process_ms"),
+        "import_ms": summary("import_ms"),
+        "init_ms": summary("init_ms"),
+        "first_plan_ms": summary("first_plan_ms"),
+        "modules_at_import": samples[0]["modules_at_import"],
+        "modules_after_plan": samples[0]["modules_after_plan"],
+    }
+
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog="bench.py", description="Trip planner benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    bench = commands.add_parser("bench", help="Benchmark plan_trip against local OpenWeather/Gemini stubs")
+    bench.add_argument("-n", "--requests", type=int, default=50)
+    bench.add_argument("-c", "--concurrency", type=int, default=8)
+    bench.add_argument("--weather-latency-ms", type=float, default=80, help="Median stub OpenWeather latency")
+    bench.add_argument("--weather-sigma", type=float, default=0.5, help="Log-normal spread of OpenWeather latency")
+    bench.add_argument("--weather-error-rate", type=float, default=0.0)
+    bench.add_argument("--llm-latency-ms", type=float, default=1200, help="Median stub Gemini latency")
+    bench.add_argument("--llm-sigma", type=float, default=0.5, help="Log-normal spread of Gemini latency")
+    bench.add_argument("--llm-error-rate", type=float, default=0.0)
+    bench.add_argument("--gemini-rpm", type=float, default=0, help="Apply a Gemini requests/minute quota (0 = none)")
+    bench.add_argument("--sequential", action="store_true", help="Disable parallel stage execution")
+    bench.add_argument("--combined", action="store_true", help="Use the single structured Gemini call")
+    bench.add_argument("--trace-memory", action="store_true", help="Also report tracemalloc peak (slows the run)")
+    bench.add_argument("--seed", type=int, default=7)
+    bench.add_argument("-o", "--output", help="Write the JSON report here as well as to stdout")
+    
+    footprint = commands.add_parser("footprint", help="Compare per-plan memory and encoded size of TripPlan and dicts")
+    footprint.add_argument("-n", "--plans", type=int, default=200, help="Plan copies kept alive for the memory figure")
+    footprint.add_argument("--rounds", type=int, default=2000, help="Encode/decode repetitions for the timings")
+    footprint.add_argument("-o", "--output", help="Write the JSON report here as well as to stdout")
+    
+    search = commands.add_parser("search-bench", help="Measure flight and hotel query latency on a synthetic inventory")
+    search.add_argument("--flights", type=int, default=500_000)
+    search.add_argument("--hotels", type=int, default=200_000)
+    search.add_argument("--routes", type=int, default=2_000, help="Destinations the offers are spread over")
+    search.add_argument("-n", "--queries", type=int, default=2_000, help="Queries of each kind")
+    search.add_argument("--seed", type=int, default=7)
+    search.add_argument("-o", "--output", help="Write the JSON report here as well as to stdout")
+    
+    startup = commands.add_parser("startup", help="Measure import time and cold start in fresh interpreters")
+    startup.add_argument("-n", "--runs", type=int, default=5)
+    startup.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    startup.add_argument("-o", "--output", help="Write the JSON report here as well as to stdout")
+    
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        report = run_benchmark(
+            args.requests, args.concurrency,
+            weather=LatencyModel(args.weather_latency_ms, args.weather_sigma, args.weather_error_rate, args.seed),
+            llm=LatencyModel(args.llm_latency_ms, args.llm_sigma, args.llm_error_rate, args.seed + 1),
+            parallel=not args.sequential, combined=args.combined, trace_memory=args.trace_memory, seed=args.seed,
+            gemini_rpm=args.gemini_rpm
+        )
+        _emit_report(report, args.output)
+    elif args.command == "footprint":
+        _emit_report(measure_footprint(args.plans, args.rounds), args.output)
+    elif args.command == "search-bench":
+        _emit_report(measure_inventory_search(args.flights, args.hotels, args.routes, args.queries, args.seed),
+                     args.output)
+    elif args.command == "startup":
+        if args.probe:
+            print(json.dumps(startup_probe()))
+            return
+        _emit_report(measure_startup(args.runs), args.output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,328 +1,3475 @@
-import streamlit as st
-import requests
+from __future__ import annotations
+
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import abc
+import argparse
+import asyncio
+import contextvars
+import difflib
+import hashlib
+import importlib
 import json
-from datetime import datetime, timedelta
-import google.generativeai as genai
-from typing import Dict, List, Any
+import logging
+import marshal
 import os
+import queue
+import random
+import re
+import sqlite3
+import sys
+import threading
+import types
+import unicodedata
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed, wait
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+class _LazyModule:
+    """Module proxy that imports on first attribute access"""
+    
+    def __init__(self, name: str):
+        self._name = name
+    
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self._name)
+        # Later lookups hit the instance dict directly instead of coming back here
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+# Heavy SDKs load on first use, keeping them off the startup path of CLI workers and fresh app processes
+st = _LazyModule("streamlit")
+requests = _LazyModule("requests")
+genai = _LazyModule("google.generativeai")
+np = _LazyModule("numpy")
+
+
+def read_secret(name: str) -> str:
+    """API key from the environment or Streamlit secrets; "" selects the built-in fallback mode"""
+    value = os.environ.get(name)
+    if value:
+        return value
+    try:
+        return st.secrets.get(name, "") or ""
+    except Exception:
+        # No secrets.toml at all
+        return ""
+
+
+def singleton(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """Turn a zero-argument factory into a getter for one process-wide instance, built on first use.
+    
+    lru_cache holds the instance; the lock only stops two first callers from both building it.
+    """
+    cached = lru_cache(maxsize=None)(factory)
+    lock = threading.Lock()
+    
+    @wraps(factory)
+    def get():
+        if cached.cache_info().currsize:
+            return cached()
+        with lock:
+            return cached()
+    
+    get.cache_info = cached.cache_info
+    get.cache_clear = cached.cache_clear
+    return get
+
+
+def process_wide(name: str, factory: Callable[[], Any]) -> Any:
+    """One object per process under name, kept outside this module's globals.
+    
+    Streamlit re-executes this file into a fresh module on every rerun, while cached agents keep
+    calling into the first run's functions; state both sides share must survive that.
+    """
+    state = sys.modules.setdefault("trip_planner_state", types.ModuleType("trip_planner_state"))
+    value = getattr(state, name, None)
+    return value if value is not None else vars(state).setdefault(name, factory())
+
+
+_gemini_key: Optional[str] = None
+_gemini_lock = threading.Lock()
+
+
+def configure_gemini(api_key: str):
+    """Point the Gemini SDK at api_key, once per key per process"""
+    global _gemini_key
+    with _gemini_lock:
+        if _gemini_key != api_key:
+            genai.configure(api_key=api_key)
+            _gemini_key = api_key
+
+
+# Observability: latency histograms, counters, per-request traces and JSON logs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms with Prometheus text export"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], List] = {}
+        self._gauges: Dict[Tuple[str, Tuple], float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+    
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+    
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+    
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0.0)
+    
+    def cache_hit_ratios(self) -> Dict[str, float]:
+        """Hit ratio per cache from trip_planner_cache_requests_total"""
+        totals: Dict[str, List[float]] = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                if name != "trip_planner_cache_requests_total":
+                    continue
+                labels = dict(labels)
+                hits_and_total = totals.setdefault(labels["cache"], [0.0, 0.0])
+                hits_and_total[1] += value
+                if labels["result"] != "miss":
+                    hits_and_total[0] += value
+        return {cache: hits / total for cache, (hits, total) in totals.items() if total}
+    
+    @staticmethod
+    def _labels(labels, **extra) -> str:
+        pairs = list(labels) + list(extra.items())
+        if not pairs:
+            return ""
+        escaped = (
+            (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, value in pairs
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+    
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+            gauges = sorted(self._gauges.items())
+        
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), (bucket_counts, total, count) in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f"{name}_bucket{self._labels(labels, le=f'{bound:g}')} {bucket_count}")
+            lines.append(f"{name}_bucket{self._labels(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+        for (name, labels), value in gauges:
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        
+        ratios = self.cache_hit_ratios()
+        if ratios:
+            lines.append("# TYPE trip_planner_cache_hit_ratio gauge")
+            for cache, ratio in sorted(ratios.items()):
+                lines.append(f'trip_planner_cache_hit_ratio{{cache="{cache}"}} {ratio:.4f}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS: Metrics = process_wide("metrics", Metrics)
+logger = logging.getLogger("trip_planner")
+
+
+def configure_json_logging(level: int = logging.INFO):
+    """Emit trip_planner events as one JSON object per line on stderr; safe to call again"""
+    # The logger outlives the module: Streamlit re-executes this file on every rerun
+    if not any(handler.get_name() == "trip_planner_json" for handler in logger.handlers):
+        handler = logging.StreamHandler(sys.stderr)
+        handler.set_name("trip_planner_json")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def log_event(event: str, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+
+if os.environ.get("TRIP_PLANNER_JSON_LOGS"):
+    configure_json_logging()
+
+
+class Trace:
+    """Spans recorded for one request, for the timing waterfall"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+    
+    def add(self, name: str, started: float, duration: float, error: Optional[str], attrs: Dict):
+        with self._lock:
+            self.spans.append({
+                "span": name,
+                "start_ms": round((started - self.started) * 1000, 1),
+                "duration_ms": round(duration * 1000, 1),
+                "error": error,
+                **attrs,
+            })
+    
+    def waterfall(self) -> List[Dict]:
+        with self._lock:
+            return sorted(self.spans, key=lambda span: span["start_ms"])
+
+
+_current_trace: contextvars.ContextVar = process_wide(
+    "current_trace", lambda: contextvars.ContextVar("trip_planner_trace", default=None)
+)
+
+
+@contextmanager
+def start_trace(name: str) -> Iterator[Trace]:
+    """Collect every span opened in this context (and in work submitted via submit_in_context)"""
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict]:
+    """Time a stage or outbound call. The yielded dict takes extra attributes; set "error" to flag a handled failure."""
+    started = time.perf_counter()
+    info = dict(attrs)
+    try:
+        yield info
+    except Exception as e:
+        info["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        error = info.pop("error", None)
+        METRICS.observe("trip_planner_stage_seconds", duration, stage=name)
+        if error:
+            METRICS.inc("trip_planner_errors_total", stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, started, duration, error, info)
+        log_event("span", span=name, duration_ms=round(duration * 1000, 1), error=error,
+                  trace_id=trace.trace_id if trace else None, **info)
+
+
+def traced(name: str, error_of: Optional[Callable[[Any], Optional[str]]] = None):
+    """Decorator form of span; error_of maps a return value to an error label for handled failures"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as info:
+                result = fn(*args, **kwargs)
+                if error_of is not None:
+                    info["error"] = error_of(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def submit_in_context(pool: ThreadPoolExecutor, fn: Callable, *args):
+    """pool.submit that carries the current trace into the worker thread"""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+# HTTP client settings (override via environment for high-concurrency deployments)
+HTTP_POOL_SIZE = int(os.environ.get("TRIP_PLANNER_HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("TRIP_PLANNER_HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.environ.get("TRIP_PLANNER_HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.environ.get("TRIP_PLANNER_HTTP_MAX_RETRIES", "3"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+OPENWEATHER_BASE_URL = os.environ.get("TRIP_PLANNER_OPENWEATHER_URL", "https://api.openweathermap.org")
+
+# Upstream quotas (requests/tokens per minute; 0 disables that budget)
+OPENWEATHER_RPM = float(os.environ.get("TRIP_PLANNER_OPENWEATHER_RPM", "60"))
+GEMINI_RPM = float(os.environ.get("TRIP_PLANNER_GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.environ.get("TRIP_PLANNER_GEMINI_TPM", "32000"))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("TRIP_PLANNER_GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MAX_RETRIES = int(os.environ.get("TRIP_PLANNER_GEMINI_MAX_RETRIES", "2"))
+GEMINI_OUTPUT_TOKEN_ESTIMATE = 1024  # reserved per call, settled against reported usage afterwards
+# Upper bound on one Gemini call (seconds), so calls abandoned by the plan deadline can't hold limiter slots
+GEMINI_TIMEOUT = float(os.environ.get("TRIP_PLANNER_GEMINI_TIMEOUT", "30"))
+RATE_LIMIT_QUEUE_SIZE = int(os.environ.get("TRIP_PLANNER_RATE_LIMIT_QUEUE_SIZE", "64"))
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("TRIP_PLANNER_RATE_LIMIT_MAX_WAIT", "20"))
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call can't get an upstream slot before its deadline or the wait queue is full"""
+
+
+class UpstreamLimiter:
+    """Token buckets for requests (and optionally tokens) per minute, plus an AIMD concurrency limit.
+    
+    Callers over quota wait in a bounded queue instead of failing; a 429 halves the concurrency
+    limit and empties the request bucket, and each successful call grows the limit back slowly.
+    """
+    
+    def __init__(self, name: str, rpm: float, tpm: float = 0, max_concurrency: int = 8,
+                 max_queue: int = RATE_LIMIT_QUEUE_SIZE, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.limit = float(max_concurrency)
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._refilled = time.monotonic()
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._publish()
+    
+    def _publish(self):
+        METRICS.set_gauge("trip_planner_rate_limit_queue_depth", self._waiting, upstream=self.name)
+        METRICS.set_gauge("trip_planner_rate_limit_in_flight", self._in_flight, upstream=self.name)
+        METRICS.set_gauge("trip_planner_rate_limit_concurrency", int(self.limit), upstream=self.name)
+    
+    def _refill(self, now: float):
+        elapsed = now - self._refilled
+        self._refilled = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+    
+    def _delay(self, tokens: int) -> Optional[float]:
+        """Seconds until a call costing tokens fits the buckets; None while concurrency is saturated"""
+        if self._in_flight >= int(self.limit):
+            return None
+        delay = 0.0
+        if self.rpm:
+            delay = max(delay, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            delay = max(delay, (min(tokens, self.tpm) - self._tokens) * 60 / self.tpm)
+        return delay
+    
+    def _reject(self, reason: str, message: str):
+        METRICS.inc("trip_planner_rate_limit_rejected_total", upstream=self.name, reason=reason)
+        raise RateLimitExceeded(f"{self.name}: {message}")
+    
+    def acquire(self, tokens: int = 0, timeout: Optional[float] = None) -> float:
+        """Block until the call fits the quota, returning seconds waited"""
+        started = time.monotonic()
+        deadline = started + (self.max_wait if timeout is None else timeout)
+        with self._cond:
+            if self._waiting >= self.max_queue:
+                self._reject("queue_full", "rate limit queue is full")
+            self._waiting += 1
+            self._publish()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    delay = self._delay(tokens)
+                    if delay is not None and delay <= 0:
+                        break
+                    remaining = deadline - now
+                    # Give up early rather than wait for a refill that lands after the deadline
+                    if remaining <= 0 or (delay is not None and delay > remaining):
+                        self._reject("deadline", f"no quota within {deadline - started:.1f}s")
+                    self._cond.wait(remaining if delay is None else delay)
+                self._requests -= 1
+                if self.tpm:
+                    self._tokens -= min(tokens, self.tpm)
+                self._in_flight += 1
+            finally:
+                self._waiting -= 1
+                self._publish()
+        waited = time.monotonic() - started
+        METRICS.observe("trip_planner_rate_limit_wait_seconds", waited, upstream=self.name)
+        return waited
+    
+    def release(self, throttled: bool = False, reserved: int = 0, used: Optional[int] = None):
+        """Free the slot, adapting concurrency and settling reserved tokens against actual usage"""
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+                self._requests = min(self._requests, 0.0)
+                METRICS.inc("trip_planner_rate_limit_throttled_total", upstream=self.name)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            if self.tpm and used is not None:
+                self._tokens += min(reserved, self.tpm) - used
+            self._publish()
+            self._cond.notify_all()
+    
+    @contextmanager
+    def slot(self, tokens: int = 0, timeout: Optional[float] = None) -> Iterator[Dict]:
+        """Hold a slot for one upstream call; set outcome["throttled"] on a 429, outcome["tokens"] to actual usage"""
+        self.acquire(tokens, timeout)
+        outcome: Dict[str, Any] = {}
+        try:
+            yield outcome
+        finally:
+            self.release(outcome.get("throttled", False), tokens, outcome.get("tokens"))
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Gemini reports quota exhaustion as ResourceExhausted (HTTP 429)"""
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or getattr(error, "code", None) == 429
+
+
+@singleton
+def get_gemini_limiter() -> UpstreamLimiter:
+    """Return the process-wide Gemini limiter; the quota belongs to the API key, not the session"""
+    return UpstreamLimiter("gemini", GEMINI_RPM, GEMINI_TPM, GEMINI_MAX_CONCURRENCY)
+
+
+@singleton
+def get_openweather_limiter() -> UpstreamLimiter:
+    """Return the process-wide OpenWeather limiter"""
+    return UpstreamLimiter("openweather", OPENWEATHER_RPM, max_concurrency=HTTP_POOL_SIZE)
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP client with timeouts and jittered exponential backoff"""
+    
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT, max_retries: int = HTTP_MAX_RETRIES,
+                 backoff_base: float = 0.25, backoff_cap: float = 4.0,
+                 limiters: Optional[Dict[str, UpstreamLimiter]] = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        from requests.adapters import HTTPAdapter
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Per-host quota limiters; every attempt, retries included, takes a slot
+        if limiters is None:
+            limiters = {urlsplit(OPENWEATHER_BASE_URL).netloc: get_openweather_limiter()}
+        self.limiters = limiters
+    
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Delay before the next attempt: Retry-After if the server sent one, else full jitter"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_cap)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+    
+    def request(self, method: str, url: str, timeout: Optional[Tuple[float, float]] = None,
+                max_retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """Send a request with per-call timeouts, retrying connection errors, 429 and 5xx responses"""
+        if max_retries is None:
+            max_retries = self.max_retries
+        parts = urlsplit(url)
+        upstream = parts.path
+        limiter = self.limiters.get(parts.netloc)
+        with span(f"http {upstream}") as info:
+            for attempt in range(max_retries + 1):
+                if attempt:
+                    METRICS.inc("trip_planner_http_retries_total", upstream=upstream)
+                try:
+                    response = self._send(limiter, method, url, timeout=timeout or self.timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt == max_retries:
+                        raise
+                    time.sleep(self._backoff(attempt))
+                    continue
+                
+                if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                    break
+                time.sleep(self._backoff(attempt, response))
+            
+            info["status"] = response.status_code
+            if response.status_code >= 400:
+                info["error"] = f"HTTP {response.status_code}"
+            return response
+    
+    def _send(self, limiter: Optional[UpstreamLimiter], method: str, url: str, **kwargs) -> requests.Response:
+        if limiter is None:
+            return self.session.request(method, url, **kwargs)
+        with limiter.slot() as outcome:
+            response = self.session.request(method, url, **kwargs)
+            outcome["throttled"] = response.status_code == 429
+            return response
+    
+    def get(self, url: str, params: Optional[Dict] = None, timeout: Optional[Tuple[float, float]] = None) -> requests.Response:
+        return self.request("GET", url, params=params, timeout=timeout)
+    
+    def post(self, url: str, json: Optional[Dict] = None, timeout: Optional[Tuple[float, float]] = None,
+             max_retries: Optional[int] = None) -> requests.Response:
+        return self.request("POST", url, json=json, timeout=timeout, max_retries=max_retries)
+    
+    def close(self):
+        self.session.close()
+
+
+_http_client_settings: Dict[str, Any] = {}
+_http_client_lock = threading.Lock()
+
+
+@singleton
+def get_http_client() -> HttpClient:
+    """Return the process-wide HTTP client, creating it on first use"""
+    return HttpClient(**_http_client_settings)
+
+
+def configure_http_client(**settings) -> HttpClient:
+    """Replace the process-wide HTTP client, e.g. to resize the connection pool"""
+    with _http_client_lock:
+        if get_http_client.cache_info().currsize:
+            get_http_client().close()
+        _http_client_settings.clear()
+        _http_client_settings.update(settings)
+        get_http_client.cache_clear()
+        return get_http_client()
+
+
+TRIP_PLAN_ERROR_TEXT = "Unable to generate detailed itinerary at this time."
+STREAM_INTERRUPTED_TEXT = "\n\n*Generation stopped early, so this section is incomplete.*"
+MONTHS = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
+
+# Geocoding cache settings
+GEO_CACHE_PATH = os.environ.get(
+    "TRIP_PLANNER_GEO_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "geocode.sqlite3")
+)
+GEO_CACHE_LRU_SIZE = 1024
+GEO_NEGATIVE_TTL = 600  # seconds to remember "City not found"
+
+
+class GeoCache:
+    """Persistent city -> coordinates cache: in-process LRU in front of SQLite"""
+    
+    def __init__(self, path: str = GEO_CACHE_PATH, lru_size: int = GEO_CACHE_LRU_SIZE,
+                 negative_ttl: float = GEO_NEGATIVE_TTL):
+        self.lru_size = lru_size
+        self.negative_ttl = negative_ttl
+        self._lru: "OrderedDict[Tuple[str, str], Tuple[Optional[Dict], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS geocode (
+                city TEXT NOT NULL,
+                country_code TEXT NOT NULL,
+                lat REAL,
+                lon REAL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (city, country_code)
+            )"""
+        )
+    
+    @staticmethod
+    def key(city: str, country_code: str = "") -> Tuple[str, str]:
+        """Normalize case and whitespace so equivalent inputs share an entry"""
+        return " ".join(city.split()).lower(), country_code.strip().upper()
+    
+    def _expired(self, coordinates: Optional[Dict], fetched_at: float) -> bool:
+        # Positive results never expire; "not found" is only remembered briefly
+        return coordinates is None and time.time() - fetched_at > self.negative_ttl
+    
+    def _remember(self, key: Tuple[str, str], coordinates: Optional[Dict], fetched_at: float):
+        self._lru[key] = (coordinates, fetched_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+    
+    def get(self, city: str, country_code: str = "") -> Tuple[bool, Optional[Dict]]:
+        """Return (hit, coordinates); coordinates is None for a cached miss"""
+        key = self.key(city, country_code)
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                row = self._db.execute(
+                    "SELECT lat, lon, fetched_at FROM geocode WHERE city = ? AND country_code = ?", key
+                ).fetchone()
+                if row is None:
+                    METRICS.inc("trip_planner_cache_requests_total", cache="geocode", result="miss")
+                    return False, None
+                lat, lon, fetched_at = row
+                coordinates = None if lat is None else {"lat": lat, "lon": lon}
+                entry = (coordinates, fetched_at)
+            
+            coordinates, fetched_at = entry
+            if self._expired(coordinates, fetched_at):
+                self._lru.pop(key, None)
+                METRICS.inc("trip_planner_cache_requests_total", cache="geocode", result="miss")
+                return False, None
+            self._remember(key, coordinates, fetched_at)
+            METRICS.inc("trip_planner_cache_requests_total", cache="geocode", result="hit")
+            return True, coordinates
+    
+    def put(self, city: str, country_code: str, coordinates: Optional[Dict]):
+        """Store coordinates, or None to record that the city was not found"""
+        key = self.key(city, country_code)
+        fetched_at = time.time()
+        lat = coordinates["lat"] if coordinates else None
+        lon = coordinates["lon"] if coordinates else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocode (city, country_code, lat, lon, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (key[0], key[1], lat, lon, fetched_at)
+            )
+            self._remember(key, coordinates, fetched_at)
+
+
+@singleton
+def get_geo_cache() -> GeoCache:
+    """Return the process-wide geocoding cache, opening it on first use"""
+    return GeoCache()
+
+
+# Weather cache settings (seconds)
+WEATHER_TTLS = {"current": 600, "forecast": 1800}
+WEATHER_MAX_STALE = 3600  # how long past its TTL an entry may still be served while refreshing
+WEATHER_CACHE_SIZE = 512
+WEATHER_COORD_PRECISION = 2  # ~1 km; nearby lookups share an entry
+
+
+class WeatherCache:
+    """Process-wide TTL cache for OpenWeather payloads with stale-while-revalidate"""
+    
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, max_stale: float = WEATHER_MAX_STALE,
+                 max_size: int = WEATHER_CACHE_SIZE, precision: int = WEATHER_COORD_PRECISION):
+        self.ttls = dict(ttls or WEATHER_TTLS)
+        self.max_stale = max_stale
+        self.max_size = max_size
+        self.precision = precision
+        self._entries: "OrderedDict[Tuple[str, float, float], Tuple[Dict, float]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather-refresh")
+    
+    def _key(self, kind: str, lat: float, lon: float) -> Tuple[str, float, float]:
+        return kind, round(lat, self.precision), round(lon, self.precision)
+    
+    def _store(self, key: Tuple[str, float, float], payload: Dict):
+        with self._lock:
+            self._entries[key] = (payload, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def _refresh(self, key: Tuple[str, float, float], fetch: Callable[[], Optional[Dict]]):
+        try:
+            payload = fetch()
+            if payload is not None:
+                self._store(key, payload)
+        except Exception:
+            pass  # keep serving the stale entry; the next read retries
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+    
+    def get(self, kind: str, lat: float, lon: float, fetch: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """Return a cached payload, fetching on miss and refreshing in the background once stale"""
+        key = self._key(kind, lat, lon)
+        ttl = self.ttls[kind]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, stored_at = entry
+                age = time.time() - stored_at
+                if age < ttl + self.max_stale:
+                    self._entries.move_to_end(key)
+                    if age >= ttl and key not in self._refreshing:
+                        # Serve stale now; exactly one background refresh per key
+                        self._refreshing.add(key)
+                        self._refresher.submit(self._refresh, key, fetch)
+                    METRICS.inc("trip_planner_cache_requests_total", cache=f"weather_{kind}",
+                                result="hit" if age < ttl else "stale")
+                    return payload
+        
+        METRICS.inc("trip_planner_cache_requests_total", cache=f"weather_{kind}", result="miss")
+        payload = fetch()
+        if payload is not None:
+            self._store(key, payload)
+        return payload
+
+
+@singleton
+def get_weather_cache() -> WeatherCache:
+    """Return the process-wide weather cache shared by all Streamlit sessions"""
+    return WeatherCache()
+
+
+# Compact plan records
+PLAN_FORMAT_VERSION = 1  # bump when a record's fields change; packed plans of another version are rejected
+
+
+def format_inr(amount: int) -> str:
+    return f"₹{amount:,}"
+
+
+class Record:
+    """Slotted value object whose field order is its __slots__, with tuple and dict forms"""
+    
+    __slots__ = ()
+    
+    def to_tuple(self) -> Tuple:
+        return tuple(getattr(self, field) for field in self.__slots__)
+    
+    @classmethod
+    def from_tuple(cls, values: Iterable) -> Record:
+        return cls(*values)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Record:
+        return cls(**{field: data[field] for field in cls.__slots__ if field in data})
+    
+    def replace(self, **changes) -> Record:
+        return type(self)(**{**{field: getattr(self, field) for field in self.__slots__}, **changes})
+    
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and self.to_tuple() == other.to_tuple()
+    
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class DailyForecast(Record):
+    """One local day of the 5-day forecast"""
+    
+    __slots__ = ("date", "temp_min", "temp_max", "temp_mean", "precipitation_mm", "condition")
+    
+    def __init__(self, date: str, temp_min: float, temp_max: float, temp_mean: float, precipitation_mm: float,
+                 condition: str):
+        self.date = date
+        self.temp_min = temp_min
+        self.temp_max = temp_max
+        self.temp_mean = temp_mean
+        self.precipitation_mm = precipitation_mm
+        self.condition = condition
+
+
+class WeatherSummary(Record):
+    """Current conditions and the daily forecast, or just an error when weather is unavailable"""
+    
+    __slots__ = ("temp", "feels_like", "humidity", "condition", "description", "daily", "error")
+    
+    def __init__(self, temp: Optional[float] = None, feels_like: Optional[float] = None,
+                 humidity: Optional[int] = None, condition: str = "", description: str = "",
+                 daily: Iterable[DailyForecast] = (), error: Optional[str] = None):
+        self.temp = temp
+        self.feels_like = feels_like
+        self.humidity = humidity
+        self.condition = condition
+        self.description = description
+        self.daily = tuple(daily)
+        self.error = error
+    
+    @classmethod
+    def from_current(cls, current: Dict) -> WeatherSummary:
+        """Keep only what the plan shows from an OpenWeather current-weather payload"""
+        return cls(current["main"]["temp"], current["main"]["feels_like"], current["main"]["humidity"],
+                   current["weather"][0]["main"], current["weather"][0]["description"])
+    
+    @classmethod
+    def unavailable(cls, error: str) -> WeatherSummary:
+        return cls(error=error)
+    
+    @property
+    def available(self) -> bool:
+        return self.error is None
+    
+    def to_tuple(self) -> Tuple:
+        return (self.temp, self.feels_like, self.humidity, self.condition, self.description,
+                tuple(day.to_tuple() for day in self.daily), self.error)
+    
+    @classmethod
+    def from_tuple(cls, values: Iterable) -> WeatherSummary:
+        temp, feels_like, humidity, condition, description, daily, error = values
+        return cls(temp, feels_like, humidity, condition, description,
+                   (DailyForecast(*day) for day in daily), error)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {**super().to_dict(), "daily": [day.to_dict() for day in self.daily]}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> WeatherSummary:
+        return cls(**{**data, "daily": [DailyForecast.from_dict(day) for day in data.get("daily", ())]})
+
+
+class Place(Record):
+    __slots__ = ("name", "type", "rating", "lat", "lon")
+    
+    def __init__(self, name: str, type: str, rating: float, lat: Optional[float] = None, lon: Optional[float] = None):
+        self.name = name
+        self.type = type
+        self.rating = rating
+        self.lat = lat
+        self.lon = lon
+    
+    @property
+    def located(self) -> bool:
+        return self.lat is not None and self.lon is not None
+
+
+class Flight(Record):
+    """One flight offer; price in whole rupees, duration in minutes"""
+    
+    __slots__ = ("airline", "departure", "arrival", "duration_min", "price", "stops")
+    
+    def __init__(self, airline: str, departure: str, arrival: str, duration_min: int, price: int, stops: int):
+        self.airline = airline
+        self.departure = departure
+        self.arrival = arrival
+        self.duration_min = duration_min
+        self.price = price
+        self.stops = stops
+    
+    @property
+    def duration_label(self) -> str:
+        return f"{self.duration_min // 60}h {self.duration_min % 60}m"
+    
+    @property
+    def price_label(self) -> str:
+        return format_inr(self.price)
+    
+    @property
+    def stops_label(self) -> str:
+        if not self.stops:
+            return "Non-stop"
+        return f"{self.stops} stop{'s' if self.stops > 1 else ''}"
+
+
+class Hotel(Record):
+    """One hotel offer; price in whole rupees per night"""
+    
+    __slots__ = ("name", "rating", "price_per_night", "amenities")
+    
+    def __init__(self, name: str, rating: float, price_per_night: int, amenities: Iterable[str] = ()):
+        self.name = name
+        self.rating = rating
+        self.price_per_night = price_per_night
+        self.amenities = tuple(amenities)
+    
+    @property
+    def price_label(self) -> str:
+        return format_inr(self.price_per_night)
+
+
+class TripPlan(Record):
+    """A finished plan as returned by plan_trip and the planning service.
+    
+    pack() is a versioned marshal encoding for this process's own caches only; marshal isn't safe
+    against crafted input, so anything crossing the network goes through to_dict()/from_dict().
+    """
+    
+    __slots__ = ("city_description", "weather", "climate", "places", "flights", "hotels", "trip_plan",
+                 "itinerary_days", "duration", "month", "degraded")
+    
+    def __init__(self, city_description: str = "", weather: Optional[WeatherSummary] = None,
+                 climate: Optional[Dict] = None, places: Iterable[Place] = (), flights: Iterable[Flight] = (),
+                 hotels: Iterable[Hotel] = (), trip_plan: str = "", itinerary_days: Optional[List[Dict]] = None,
+                 duration: int = 0, month: str = "", degraded: Iterable[str] = ()):
+        self.city_description = city_description
+        self.weather = weather
+        self.climate = climate
+        self.places = tuple(places)
+        self.flights = tuple(flights)
+        self.hotels = tuple(hotels)
+        self.trip_plan = trip_plan
+        self.itinerary_days = itinerary_days
+        self.duration = duration
+        self.month = month
+        self.degraded = tuple(degraded)
+    
+    def to_tuple(self) -> Tuple:
+        return (self.city_description, self.weather.to_tuple() if self.weather is not None else None, self.climate,
+                tuple(place.to_tuple() for place in self.places), tuple(flight.to_tuple() for flight in self.flights),
+                tuple(hotel.to_tuple() for hotel in self.hotels), self.trip_plan, self.itinerary_days,
+                self.duration, self.month, self.degraded)
+    
+    @classmethod
+    def from_tuple(cls, values: Iterable) -> TripPlan:
+        (city_description, weather, climate, places, flights, hotels, trip_plan, itinerary_days,
+         duration, month, degraded) = values
+        return cls(city_description, WeatherSummary.from_tuple(weather) if weather is not None else None, climate,
+                   (Place(*place) for place in places), (Flight(*flight) for flight in flights),
+                   (Hotel(*hotel) for hotel in hotels), trip_plan, itinerary_days, duration, month, degraded)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **super().to_dict(),
+            "weather": self.weather.to_dict() if self.weather is not None else None,
+            "places": [place.to_dict() for place in self.places],
+            "flights": [flight.to_dict() for flight in self.flights],
+            "hotels": [hotel.to_dict() for hotel in self.hotels],
+            "degraded": list(self.degraded),
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> TripPlan:
+        weather = data.get("weather")
+        return cls(**{
+            **data,
+            "weather": WeatherSummary.from_dict(weather) if weather is not None else None,
+            "places": [Place.from_dict(place) for place in data.get("places", ())],
+            "flights": [Flight.from_dict(flight) for flight in data.get("flights", ())],
+            "hotels": [Hotel.from_dict(hotel) for hotel in data.get("hotels", ())],
+        })
+    
+    def pack(self) -> bytes:
+        return marshal.dumps((PLAN_FORMAT_VERSION, self.to_tuple()), 4)
+    
+    @classmethod
+    def unpack(cls, data: bytes) -> TripPlan:
+        try:
+            version, values = marshal.loads(data)
+        except (EOFError, ValueError, TypeError) as e:
+            raise ValueError(f"Not a packed trip plan: {e}") from None
+        if version != PLAN_FORMAT_VERSION:
+            raise ValueError(f"Packed trip plan has format {version}, expected {PLAN_FORMAT_VERSION}")
+        return cls.from_tuple(values)
+
+
+# Forecast and climate summaries
+CLIMATOLOGY_PATH = os.environ.get(
+    "TRIP_PLANNER_CLIMATOLOGY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "climatology.json")
+)
+
+
+def aggregate_forecast(forecast: Dict) -> List[DailyForecast]:
+    """Collapse an OpenWeather 5-day/3-hour forecast into one compact summary per local day"""
+    entries = forecast.get("list") or []
+    if not entries:
+        return []
+    count = len(entries)
+    offset = forecast.get("city", {}).get("timezone", 0)
+    
+    # Columnar view of the 3-hourly entries
+    dt = np.fromiter((entry["dt"] for entry in entries), dtype=np.int64, count=count)
+    temp = np.fromiter((entry["main"]["temp"] for entry in entries), dtype=float, count=count)
+    temp_min = np.fromiter((entry["main"].get("temp_min", entry["main"]["temp"]) for entry in entries), dtype=float, count=count)
+    temp_max = np.fromiter((entry["main"].get("temp_max", entry["main"]["temp"]) for entry in entries), dtype=float, count=count)
+    precipitation = np.fromiter(
+        (entry.get("rain", {}).get("3h", 0.0) + entry.get("snow", {}).get("3h", 0.0) for entry in entries),
+        dtype=float, count=count
+    )
+    labels, condition = np.unique([entry["weather"][0]["main"] for entry in entries], return_inverse=True)
+    
+    # One grouped pass per statistic, keyed by local calendar day
+    days, day = np.unique((dt + offset) // 86400, return_inverse=True)
+    mean = np.bincount(day, weights=temp) / np.bincount(day)
+    low = np.full(len(days), np.inf)
+    np.minimum.at(low, day, temp_min)
+    high = np.full(len(days), -np.inf)
+    np.maximum.at(high, day, temp_max)
+    rain = np.bincount(day, weights=precipitation, minlength=len(days))
+    votes = np.zeros((len(days), len(labels)), dtype=np.int32)
+    np.add.at(votes, (day, condition), 1)
+    dominant = labels[votes.argmax(axis=1)]
+    
+    return [
+        DailyForecast(
+            datetime.fromtimestamp(int(days[i]) * 86400, tz=timezone.utc).strftime("%Y-%m-%d"),
+            round(float(low[i]), 1),
+            round(float(high[i]), 1),
+            round(float(mean[i]), 1),
+            round(float(rain[i]), 1),
+            str(dominant[i]),
+        )
+        for i in range(len(days))
+    ]
+
+
+def describe_climate(avg_high: float, avg_low: float, precipitation: float) -> str:
+    """Short human summary of a month's climate normals"""
+    mean = (avg_high + avg_low) / 2
+    if mean < 5:
+        feel = "Cold"
+    elif mean < 12:
+        feel = "Cool"
+    elif mean < 20:
+        feel = "Mild"
+    elif mean < 27:
+        feel = "Warm"
+    else:
+        feel = "Hot"
+    
+    if precipitation < 30:
+        wetness = "little rain"
+    elif precipitation < 100:
+        wetness = "some rain"
+    elif precipitation < 250:
+        wetness = "frequent rain"
+    else:
+        wetness = "heavy rainy-season downpours"
+    return f"{feel} with {wetness}"
+
+
+class Climatology:
+    """Monthly climate normals for catalog destinations, held as one (cities, 12, fields) array"""
+    
+    def __init__(self, names: List[str], normals: np.ndarray):
+        self._rows = {name: row for row, name in enumerate(names)}
+        self.normals = normals
+    
+    @classmethod
+    def load(cls, path: str = CLIMATOLOGY_PATH) -> "Climatology":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        names = list(data["normals"])
+        normals = np.array([data["normals"][name] for name in names], dtype=np.float32).reshape(len(names), 12, -1)
+        return cls(names, normals)
+    
+    def summary(self, city: str, month: str) -> Optional[Dict]:
+        """Typical conditions for a catalog city in a month, or None if there are no normals"""
+        row = self._rows.get(city)
+        if row is None or month not in MONTHS:
+            return None
+        avg_high, avg_low, precipitation = (float(value) for value in self.normals[row, MONTHS.index(month)])
+        return {
+            "month": month,
+            "avg_high_c": round(avg_high, 1),
+            "avg_low_c": round(avg_low, 1),
+            "precipitation_mm": round(precipitation),
+            "summary": describe_climate(avg_high, avg_low, precipitation),
+        }
+
+
+@singleton
+def get_climatology() -> Climatology:
+    """Return the process-wide climatology table, loading it on first use"""
+    return Climatology.load()
+
+
+# LLM response cache settings
+GEMINI_MODEL_NAME = "gemini-pro"
+LLM_CACHE_PATH = os.environ.get(
+    "TRIP_PLANNER_LLM_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm.sqlite3")
+)
+LLM_CACHE_TTL = 7 * 24 * 3600  # seconds
+LLM_CACHE_MEMORY_BYTES = 8 * 1024 * 1024
+LLM_CACHE_DISK_BYTES = 256 * 1024 * 1024
+WEATHER_TEMP_BUCKET = 3  # °C; prompts within the same bucket share a cache entry
+
+
+class LLMCache:
+    """Content-addressed Gemini response cache: in-memory LRU tier in front of SQLite"""
+    
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 memory_bytes: int = LLM_CACHE_MEMORY_BYTES, disk_bytes: int = LLM_CACHE_DISK_BYTES):
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+    
+    @staticmethod
+    def key(model_name: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+    
+    def _remember(self, key: str, response: str, expires_at: float):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old[0].encode("utf-8"))
+        self._memory[key] = (response, expires_at)
+        self._memory_size += len(response.encode("utf-8"))
+        while self._memory_size > self.memory_bytes and self._memory:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted.encode("utf-8"))
+    
+    def get(self, model_name: str, prompt: str) -> Optional[str]:
+        """Return the cached response for this model and prompt, or None"""
+        key = self.key(model_name, prompt)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                METRICS.inc("trip_planner_cache_requests_total", cache="llm", result="hit")
+                return entry[0]
+            
+            row = self._db.execute(
+                "SELECT response, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                METRICS.inc("trip_planner_cache_requests_total", cache="llm", result="miss")
+                return None
+            self._db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._remember(key, row[0], row[1])
+            self.hits["disk"] += 1
+            METRICS.inc("trip_planner_cache_requests_total", cache="llm", result="hit")
+            return row[0]
+    
+    def put(self, model_name: str, prompt: str, response: str, ttl: Optional[float] = None):
+        """Store a response in both tiers, evicting least recently used disk entries over budget"""
+        key = self.key(model_name, prompt)
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, response, expires_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), expires_at, now)
+            )
+            self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+            if total > self.disk_bytes:
+                overflow = total - self.disk_bytes
+                doomed = []
+                for doomed_key, size in self._db.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at"):
+                    doomed.append((doomed_key,))
+                    overflow -= size
+                    if overflow <= 0:
+                        break
+                self._db.executemany("DELETE FROM llm_cache WHERE key = ?", doomed)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            hits = self.hits["memory"] + self.hits["disk"]
+            lookups = hits + self.misses
+            disk_entries, disk_size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            return {
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_size,
+            }
+
+
+@singleton
+def get_llm_cache() -> LLMCache:
+    """Return the process-wide LLM response cache, opening it on first use"""
+    return LLMCache()
 
-# Configure page
-st.set_page_config(
-    page_title="AI Trip Planner Agent",
-    page_icon="✈️",
-    layout="wide"
+
+# Precomputed plan warehouse
+PLAN_STORE_PATH = os.environ.get(
+    "TRIP_PLANNER_PLAN_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "plans.sqlite3")
 )
+PLAN_STORE_MAX_AGE = 30 * 24 * 3600  # seconds before the precompute job rebuilds an entry
+PLAN_STORE_SECTIONS = ("places", "flights", "hotels", "city_description", "trip_plan", "itinerary_days")
 
 
-# Configure Gemini API
-GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+class PlanWarehouse:
+    """Precomputed plan sections, one zlib-compressed packed TripPlan per (city, duration, month).
+    
+    Everything except live weather and the locally computed climate is stored. Stale rows
+    keep serving until the precompute job rebuilds them.
+    """
+    
+    def __init__(self, path: str = PLAN_STORE_PATH, max_age: float = PLAN_STORE_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != PLAN_FORMAT_VERSION:
+            # Rows in another payload format can't be read back; the precompute job rebuilds them
+            self._db.execute("DROP TABLE IF EXISTS plans")
+            self._db.execute(f"PRAGMA user_version = {PLAN_FORMAT_VERSION}")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS plans (
+                city TEXT NOT NULL,
+                duration INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                built_at REAL NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (city, duration, month)
+            ) WITHOUT ROWID"""
+        )
+    
+    def get(self, city: str, duration: int, month: str) -> Optional[TripPlan]:
+        """Stored sections for a catalog city name, or None"""
+        row = None
+        if month in MONTHS:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT payload FROM plans WHERE city = ? AND duration = ? AND month = ?",
+                    (city, duration, MONTHS.index(month))
+                ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        METRICS.inc("trip_planner_cache_requests_total", cache="plan_store", result="miss" if row is None else "hit")
+        return None if row is None else TripPlan.unpack(zlib.decompress(row[0]))
+    
+    def put(self, city: str, duration: int, month: str, plan: TripPlan, model: str):
+        sections = TripPlan(**{section: getattr(plan, section) for section in PLAN_STORE_SECTIONS})
+        payload = zlib.compress(sections.pack(), 9)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO plans (city, duration, month, model, built_at, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                (city, duration, MONTHS.index(month), model, time.time(), payload)
+            )
+    
+    def stale(self, keys: List[Tuple[str, int, str]], model: str) -> List[Tuple[str, int, str]]:
+        """Keys that are missing, older than max_age or built with a different model"""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            fresh = {
+                (city, duration, MONTHS[month])
+                for city, duration, month in self._db.execute(
+                    "SELECT city, duration, month FROM plans WHERE built_at > ? AND model = ?", (cutoff, model)
+                )
+            }
+        return [key for key in keys if key not in fresh]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, on-disk size and this process's hit rate"""
+        with self._lock:
+            entries, payload_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM plans"
+            ).fetchone()
+            stale = self._db.execute(
+                "SELECT COUNT(*) FROM plans WHERE built_at <= ?", (time.time() - self.max_age,)
+            ).fetchone()[0]
+            pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "stale_entries": stale,
+                "payload_bytes": payload_bytes,
+                "file_bytes": pages * page_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+@singleton
+def get_plan_warehouse() -> PlanWarehouse:
+    """Return the process-wide plan warehouse, opening it on first use"""
+    return PlanWarehouse()
+
+
+# In-flight request coalescing
+class _Flight:
+    """One in-flight call: its result or error, plus streamed chunks for late joiners"""
+    
+    __slots__ = ("done", "result", "error", "chunks", "cond")
+    
+    def __init__(self):
+        self.done = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.chunks: List[str] = []
+        self.cond = threading.Condition()
+    
+    def finish(self, result: Any = None, error: Optional[BaseException] = None):
+        with self.cond:
+            self.result, self.error, self.done = result, error, True
+            self.cond.notify_all()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key so only one reaches the upstream API"""
+    
+    def __init__(self):
+        self._flights: Dict[Tuple, _Flight] = {}
+        self._lock = threading.Lock()
+    
+    def _join(self, key: Tuple) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        METRICS.inc("trip_planner_singleflight_total", call=key[0], role="leader" if leader else "follower")
+        return flight, leader
+    
+    def _leave(self, key: Tuple, flight: _Flight, result: Any = None, error: Optional[BaseException] = None):
+        # Forget the flight before publishing so later callers start a fresh call
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(result, error)
+    
+    def do(self, key: Tuple, fn: Callable[[], Any]) -> Any:
+        """Run fn once per key among concurrent callers; everyone gets its result or error"""
+        flight, leader = self._join(key)
+        if not leader:
+            with flight.cond:
+                flight.cond.wait_for(lambda: flight.done)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            result = fn()
+        except BaseException as e:
+            self._leave(key, flight, error=e)
+            raise
+        self._leave(key, flight, result)
+        return result
+    
+    def stream(self, key: Tuple, start: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """Share one streamed call per key; followers replay chunks so far, then follow live"""
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                for chunk in start():
+                    with flight.cond:
+                        flight.chunks.append(chunk)
+                        flight.cond.notify_all()
+                    yield chunk
+            except GeneratorExit:
+                self._leave(key, flight, error=RuntimeError("Shared stream abandoned"))
+                raise
+            except BaseException as e:
+                self._leave(key, flight, error=e)
+                raise
+            self._leave(key, flight)
+            return
+        
+        emitted = 0
+        while True:
+            with flight.cond:
+                flight.cond.wait_for(lambda: flight.done or len(flight.chunks) > emitted)
+                pending = flight.chunks[emitted:]
+                done, error = flight.done, flight.error
+            for chunk in pending:
+                yield chunk
+            emitted += len(pending)
+            if done and emitted == len(flight.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+@singleton
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide coalescer shared by every session's agent"""
+    return SingleFlight()
+
+
+# Per-request latency budget (seconds, 0 disables) and the share of it each stage may use.
+# Sized for the streamed UI, where a text stage only has to start in time; run_service uses SERVICE_PLAN_DEADLINE
+PLAN_DEADLINE = float(os.environ.get("TRIP_PLANNER_PLAN_DEADLINE", "4"))
+STAGE_BUDGET = {"weather": 0.4, "places": 0.4, "flights": 0.4, "hotels": 0.4,
+                "city_description": 1.0, "trip_plan": 1.0}
+STREAM_IDLE_TIMEOUT = 2.0  # a stream past its deadline keeps going only while chunks keep arriving
+# Start a duplicate upstream call when the first is slower than this (seconds, 0 disables)
+HEDGE_AFTER = float(os.environ.get("TRIP_PLANNER_HEDGE_AFTER", "0"))
+
+
+class PlanBudget:
+    """Deadlines for each stage of one plan, measured from when planning started"""
+    
+    def __init__(self, total: Optional[float], stages: Optional[Dict[str, float]] = None):
+        self.total = total or None
+        self.stages = stages or STAGE_BUDGET
+        self.started = time.monotonic()
+    
+    def remaining(self, stage: str) -> Optional[float]:
+        """Seconds left for the stage, or None without a budget"""
+        if self.total is None:
+            return None
+        deadline = self.started + self.total * self.stages.get(stage, 1.0)
+        return max(0.0, deadline - time.monotonic())
+    
+    def expired(self, stage: str) -> bool:
+        return self.remaining(stage) == 0.0
+
+
+@singleton
+def get_hedge_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+def hedged(fn: Callable[[], Any], after: Optional[float]) -> Any:
+    """Call fn, racing one duplicate if it hasn't returned within `after` seconds; first success wins"""
+    if not after:
+        return fn()
+    pool = get_hedge_pool()
+    futures = [submit_in_context(pool, fn)]
+    if not wait(futures, timeout=after).done:
+        METRICS.inc("trip_planner_hedged_calls_total")
+        futures.append(submit_in_context(pool, fn))
+    error: Optional[BaseException] = None
+    for future in as_completed(futures):
+        error = future.exception()
+        if error is None:
+            return future.result()
+    raise error
+
+
+# Destination catalog
+CATALOG_PATH = os.environ.get(
+    "TRIP_PLANNER_CATALOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "destinations.json")
+)
+CATALOG_FUZZY_CUTOFF = 0.85
+
+
+class Destination:
+    """One catalog entry; places are kept as (name, type, rating[, lat, lon]) tuples to stay compact"""
+    
+    __slots__ = ("name", "country_code", "lat", "lon", "description", "places")
+    
+    def __init__(self, name: str, country_code: str, lat: Optional[float], lon: Optional[float],
+                 description: Optional[str], places: Tuple[Tuple, ...]):
+        self.name = name
+        self.country_code = country_code
+        self.lat = lat
+        self.lon = lon
+        self.description = description
+        self.places = places
+    
+    @property
+    def coordinates(self) -> Optional[Dict]:
+        if self.lat is None or self.lon is None:
+            return None
+        return {"lat": self.lat, "lon": self.lon}
+    
+    def places_list(self) -> List[Place]:
+        return [Place(*place) for place in self.places]
+
+
+class DestinationCatalog:
+    """Load-once destination index with normalized and alias-aware lookup, plus fuzzy suggestions.
+    
+    lookup() only returns exact, alias and "Name, CC" matches, since its result decides whose
+    coordinates, offers and stored plans a request gets; suggest() offers a close spelling for
+    the user to confirm.
+    """
+    
+    def __init__(self, destinations: List[Destination], aliases: Dict[str, List[str]], cache_size: int = 4096):
+        self.destinations = destinations
+        self._index: Dict[str, int] = {}
+        for position, destination in enumerate(destinations):
+            keys = [destination.name, *aliases.get(destination.name, ())]
+            if destination.country_code:
+                keys.append(f"{destination.name}, {destination.country_code}")
+            for key in keys:
+                # First entry wins, so list the better-known of two same-named cities first
+                self._index.setdefault(self.normalize(key), position)
+        
+        # Fuzzy candidates are bucketed by first letter so a miss scans one bucket, not the catalog
+        self._buckets: Dict[str, List[str]] = {}
+        for key in self._index:
+            self._buckets.setdefault(key[:1], []).append(key)
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+        self.suggest = lru_cache(maxsize=cache_size)(self._suggest)
+    
+    @classmethod
+    def load(cls, path: str = CATALOG_PATH) -> "DestinationCatalog":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        
+        destinations, aliases = [], {}
+        for entry in data["destinations"]:
+            destinations.append(Destination(
+                sys.intern(entry["name"]),
+                sys.intern(entry.get("country_code", "")),
+                entry.get("lat"),
+                entry.get("lon"),
+                entry.get("description"),
+                tuple((name, sys.intern(kind), *rest) for name, kind, *rest in entry.get("places", ()))
+            ))
+            if entry.get("aliases"):
+                aliases[entry["name"]] = entry["aliases"]
+        return cls(destinations, aliases)
+    
+    @staticmethod
+    def normalize(name: str) -> str:
+        """Case-, accent-, punctuation- and whitespace-insensitive lookup key"""
+        decomposed = unicodedata.normalize("NFKD", name)
+        stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+        cleaned = "".join(ch if ch.isalnum() or ch == "," else " " for ch in stripped.lower())
+        return " ".join(cleaned.replace(",", " , ").split()).replace(" ,", ",")
+    
+    def _lookup(self, city: str) -> Optional[Destination]:
+        key = self.normalize(city)
+        if not key:
+            return None
+        position = self._index.get(key)
+        if position is None and key.endswith(" city"):
+            position = self._index.get(key[:-len(" city")])
+        return None if position is None else self.destinations[position]
+    
+    def _suggest(self, city: str) -> Optional[str]:
+        """Name of a catalog city spelled like an unmatched one ("Tokio" -> "Tokyo"), or None.
+        
+        Look-alikes can be different places (Delphi is not Delhi), so only offer this for confirmation.
+        """
+        key = self.normalize(city)
+        if not key or self.lookup(city) is not None:
+            return None
+        matches = difflib.get_close_matches(key, self._buckets.get(key[:1], ()), n=1, cutoff=CATALOG_FUZZY_CUTOFF)
+        return self.destinations[self._index[matches[0]]].name if matches else None
+    
+    def __len__(self) -> int:
+        return len(self.destinations)
+
+
+@singleton
+def get_catalog() -> DestinationCatalog:
+    """Return the process-wide destination catalog, loading it on first use"""
+    return DestinationCatalog.load()
+
+
+# Flight and hotel inventory
+INVENTORY_PATH = os.environ.get(
+    "TRIP_PLANNER_INVENTORY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "inventory.json")
+)
+FLIGHT_RESULTS = 3
+HOTEL_RESULTS = 3
+
+
+def parse_price(value: Any) -> int:
+    """Whole rupees from a number or a provider string such as "₹18,500" or "18500.00 INR" """
+    if isinstance(value, (int, float)):
+        return int(round(value))
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", str(value))
+    if match is None:
+        raise ValueError(f"No amount in price {value!r}")
+    return int(round(float(match.group().replace(",", ""))))
+
+
+def parse_duration(value: Any) -> int:
+    """Minutes from a number or a string such as "6h 45m" """
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r"\s*(?:(\d+)\s*h)?\s*(?:(\d+)\s*m)?\s*", str(value))
+    if match is None or not any(match.groups()):
+        raise ValueError(f"Unrecognized duration {value!r}")
+    return int(match.group(1) or 0) * 60 + int(match.group(2) or 0)
+
+
+def parse_stops(value: Any) -> int:
+    """Stop count from a number or a string such as "Non-stop" or "1 stop" """
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().lower()
+    if text in ("non-stop", "nonstop", "direct"):
+        return 0
+    match = re.match(r"\d+", text)
+    if match is None:
+        raise ValueError(f"Unrecognized stops {value!r}")
+    return int(match.group())
+
+
+class InventoryProvider(abc.ABC):
+    """Flight and hotel search backend; a booking API plugs in by implementing both searches"""
+    
+    @abc.abstractmethod
+    def search_flights(self, destination: str, origin: Optional[str] = None, max_price: Optional[int] = None,
+                       max_stops: Optional[int] = None, max_duration: Optional[int] = None,
+                       airlines: Iterable[str] = (), sort: str = "price", limit: int = FLIGHT_RESULTS) -> List[Flight]:
+        """Flights into a destination city matching every given filter, best first by "price" or "duration" """
+    
+    @abc.abstractmethod
+    def search_hotels(self, city: str, max_price: Optional[int] = None, min_rating: Optional[float] = None,
+                      amenities: Iterable[str] = (), sort: str = "price", limit: int = HOTEL_RESULTS) -> List[Hotel]:
+        """Hotels in a city matching every given filter, best first by "price" or "rating" """
+
+
+class TemplateInventory(InventoryProvider):
+    """Generic offers for any city, filled in from templates with {city} and {code} placeholders"""
+    
+    def __init__(self, flights: List[Dict[str, Any]], hotels: List[Dict[str, Any]]):
+        self.flights = [
+            {"airline": offer["airline"], "departure": offer["departure"], "arrival": offer["arrival"],
+             "duration": parse_duration(offer["duration"]), "price": parse_price(offer["price"]),
+             "stops": parse_stops(offer["stops"])}
+            for offer in flights
+        ]
+        self.hotels = [
+            {"name": offer["name"], "rating": float(offer["rating"]), "price": parse_price(offer["price_per_night"]),
+             "amenities": tuple(offer.get("amenities", ()))}
+            for offer in hotels
+        ]
+    
+    @staticmethod
+    def _fill(template: str, city: str) -> str:
+        letters = "".join(ch for ch in DestinationCatalog.normalize(city) if "a" <= ch <= "z")
+        return template.format(city=city, code=letters[:3].upper() or "XXX")
+    
+    def search_flights(self, destination: str, origin: Optional[str] = None, max_price: Optional[int] = None,
+                       max_stops: Optional[int] = None, max_duration: Optional[int] = None,
+                       airlines: Iterable[str] = (), sort: str = "price", limit: int = FLIGHT_RESULTS) -> List[Flight]:
+        if sort not in ("price", "duration"):
+            raise ValueError(f"Unknown flight sort {sort!r}")
+        airlines = set(airlines)
+        offers = [
+            Flight(offer["airline"], self._fill(offer["departure"], destination), self._fill(offer["arrival"], destination),
+                   offer["duration"], offer["price"], offer["stops"])
+            for offer in self.flights
+            if (origin is None or offer["departure"] == origin) and (max_price is None or offer["price"] <= max_price)
+            and (max_stops is None or offer["stops"] <= max_stops)
+            and (max_duration is None or offer["duration"] <= max_duration)
+            and (not airlines or offer["airline"] in airlines)
+        ]
+        offers.sort(key=lambda f: f.price if sort == "price" else (f.duration_min, f.price))
+        return offers[:max(limit, 0)]
+    
+    def search_hotels(self, city: str, max_price: Optional[int] = None, min_rating: Optional[float] = None,
+                      amenities: Iterable[str] = (), sort: str = "price", limit: int = HOTEL_RESULTS) -> List[Hotel]:
+        if sort not in ("price", "rating"):
+            raise ValueError(f"Unknown hotel sort {sort!r}")
+        required = set(amenities)
+        offers = [
+            Hotel(self._fill(offer["name"], city), offer["rating"], offer["price"], offer["amenities"])
+            for offer in self.hotels
+            if (max_price is None or offer["price"] <= max_price)
+            and (min_rating is None or offer["rating"] >= min_rating) and required.issubset(offer["amenities"])
+        ]
+        offers.sort(key=lambda h: h.price_per_night if sort == "price" else (-h.rating, h.price_per_night))
+        return offers[:max(limit, 0)]
+
+
+class OfferTable:
+    """Offer columns sorted by (route, price), so each route is one contiguous, price-ordered slice"""
+    
+    def __init__(self, routes: int, route: np.ndarray, price: np.ndarray, **columns: np.ndarray):
+        order = np.lexsort((price, route))
+        self.order = order  # table position -> input row
+        self.bounds = np.searchsorted(route[order], np.arange(routes + 1))
+        self.price = price[order]
+        self.columns = {name: column[order] for name, column in columns.items()}
+    
+    def __len__(self) -> int:
+        return len(self.price)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.order.nbytes + self.bounds.nbytes + self.price.nbytes + sum(c.nbytes for c in self.columns.values())
+    
+    def candidates(self, route: int, max_price: Optional[int] = None) -> Tuple[int, int]:
+        """[start, stop) of the route's offers, cut at max_price by binary search"""
+        start, stop = int(self.bounds[route]), int(self.bounds[route + 1])
+        if max_price is not None:
+            stop = start + int(np.searchsorted(self.price[start:stop], max_price, side="right"))
+        return start, stop
+    
+    @staticmethod
+    def top(start: int, stop: int, mask: Optional[np.ndarray], rank: Optional[np.ndarray], limit: int) -> np.ndarray:
+        """Positions of the first `limit` offers in [start, stop) passing mask, by rank and then price"""
+        positions = np.arange(start, stop)
+        if mask is not None:
+            positions = positions[mask]
+        if rank is None:
+            return positions[:limit]
+        keys = rank if mask is None else rank[mask]
+        if len(keys) > limit:
+            # Only keys up to the limit-th smallest, ties included, can make the cut
+            keep = keys <= keys[np.argpartition(keys, limit - 1)[limit - 1]]
+            positions, keys = positions[keep], keys[keep]
+        # A stable sort keeps equally ranked offers in price order
+        return positions[np.argsort(keys, kind="stable")][:limit]
+
+
+class LocalInventory(InventoryProvider):
+    """In-memory offers as numeric columns indexed by route for filter-plus-top-k queries.
+    
+    A query takes its route's price-ordered slice, cuts it at max_price by binary search and only
+    then filters that slice on the stops, duration, airline, rating and amenity bitmask columns.
+    Queries for a destination with no offers at all go to the fallback provider, if there is one.
+    """
+    
+    def __init__(self, routes: List[str], airlines: List[str], airports: List[str], amenities: List[str],
+                 flights: Dict[str, np.ndarray], hotels: Dict[str, np.ndarray], hotel_names: List[str],
+                 fallback: Optional[InventoryProvider] = None):
+        self._routes = {DestinationCatalog.normalize(name): index for index, name in enumerate(routes)}
+        self.airlines = airlines
+        self.airports = airports
+        self.amenities = amenities
+        self._airline_ids = {name: index for index, name in enumerate(airlines)}
+        self._airport_ids = {code: index for index, code in enumerate(airports)}
+        self._amenity_bits = {name: 1 << index for index, name in enumerate(amenities)}
+        # flights: route, price, airline, departure, arrival, duration (min), stops
+        self.flights = OfferTable(len(routes), **flights)
+        # hotels: route, price (per night), rating (tenths), amenities (bitmask)
+        self.hotels = OfferTable(len(routes), **hotels)
+        self.hotel_names = [hotel_names[row] for row in self.hotels.order]
+        self.fallback = fallback
+    
+    @classmethod
+    def load(cls, path: str = INVENTORY_PATH) -> LocalInventory:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        fields = data["fields"]
+        templates = data.get("templates")
+        return cls.from_offers(
+            [dict(zip(fields["flights"], row)) for row in data["flights"]],
+            [dict(zip(fields["hotels"], row)) for row in data["hotels"]],
+            fallback=TemplateInventory(
+                [dict(zip(fields["flights"], row)) for row in templates["flights"]],
+                [dict(zip(fields["hotels"], row)) for row in templates["hotels"]]
+            ) if templates else None
+        )
+    
+    @classmethod
+    def from_offers(cls, flights: List[Dict[str, Any]], hotels: List[Dict[str, Any]],
+                    fallback: Optional[InventoryProvider] = None) -> LocalInventory:
+        """Build from provider-style offers, parsing display prices, durations and stops into numbers"""
+        routes: Dict[str, int] = {}
+        airlines: Dict[str, int] = {}
+        airports: Dict[str, int] = {}
+        amenities: Dict[str, int] = {}
+        
+        def ids(vocabulary: Dict[str, int], values: Iterable[str], dtype) -> np.ndarray:
+            return np.array([vocabulary.setdefault(sys.intern(value), len(vocabulary)) for value in values], dtype=dtype)
+        
+        def bitmask(names: Iterable[str]) -> int:
+            # dict.fromkeys drops repeats but keeps first-seen order for the amenity vocabulary
+            return sum(1 << amenities.setdefault(sys.intern(name), len(amenities)) for name in dict.fromkeys(names))
+        
+        flight_columns = {
+            "route": ids(routes, (offer["destination"] for offer in flights), np.int32),
+            "price": np.array([parse_price(offer["price"]) for offer in flights], dtype=np.int32),
+            "airline": ids(airlines, (offer["airline"] for offer in flights), np.int16),
+            "departure": ids(airports, (offer["departure"] for offer in flights), np.int16),
+            "arrival": ids(airports, (offer["arrival"] for offer in flights), np.int16),
+            "duration": np.array([parse_duration(offer["duration"]) for offer in flights], dtype=np.int16),
+            "stops": np.array([parse_stops(offer["stops"]) for offer in flights], dtype=np.int8),
+        }
+        hotel_columns = {
+            "route": ids(routes, (offer["city"] for offer in hotels), np.int32),
+            "price": np.array([parse_price(offer["price_per_night"]) for offer in hotels], dtype=np.int32),
+            "rating": np.array([round(float(offer["rating"]) * 10) for offer in hotels], dtype=np.int16),
+            "amenities": np.array([bitmask(offer.get("amenities", ())) for offer in hotels], dtype=np.int64),
+        }
+        if len(amenities) > 63:
+            raise ValueError("At most 63 distinct hotel amenities are supported")
+        return cls(list(routes), list(airlines), list(airports), list(amenities), flight_columns, hotel_columns,
+                   [sys.intern(offer["name"]) for offer in hotels], fallback)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.flights.nbytes + self.hotels.nbytes
+    
+    def search_flights(self, destination: str, origin: Optional[str] = None, max_price: Optional[int] = None,
+                       max_stops: Optional[int] = None, max_duration: Optional[int] = None,
+                       airlines: Iterable[str] = (), sort: str = "price", limit: int = FLIGHT_RESULTS) -> List[Flight]:
+        if sort not in ("price", "duration"):
+            raise ValueError(f"Unknown flight sort {sort!r}")
+        route = self._routes.get(DestinationCatalog.normalize(destination))
+        airlines = tuple(airlines)
+        if route is None:
+            if self.fallback is None:
+                return []
+            return self.fallback.search_flights(destination, origin, max_price, max_stops, max_duration, airlines,
+                                                sort, limit)
+        airline_ids = [self._airline_ids[name] for name in airlines if name in self._airline_ids]
+        if limit <= 0 or (origin is not None and origin not in self._airport_ids) or (airlines and not airline_ids):
+            return []
+        table = self.flights
+        start, stop = table.candidates(route, max_price)
+        
+        column = {name: values[start:stop] for name, values in table.columns.items()}
+        conditions = []
+        if origin is not None:
+            conditions.append(column["departure"] == self._airport_ids[origin])
+        if max_stops is not None:
+            conditions.append(column["stops"] <= max_stops)
+        if max_duration is not None:
+            conditions.append(column["duration"] <= max_duration)
+        if airline_ids:
+            conditions.append(np.isin(column["airline"], airline_ids))
+        mask = np.logical_and.reduce(conditions) if conditions else None
+        rank = column["duration"] if sort == "duration" else None
+        
+        columns = table.columns
+        return [
+            Flight(self.airlines[columns["airline"][i]], self.airports[columns["departure"][i]],
+                   self.airports[columns["arrival"][i]], int(columns["duration"][i]), int(table.price[i]),
+                   int(columns["stops"][i]))
+            for i in table.top(start, stop, mask, rank, limit)
+        ]
+    
+    def search_hotels(self, city: str, max_price: Optional[int] = None, min_rating: Optional[float] = None,
+                      amenities: Iterable[str] = (), sort: str = "price", limit: int = HOTEL_RESULTS) -> List[Hotel]:
+        if sort not in ("price", "rating"):
+            raise ValueError(f"Unknown hotel sort {sort!r}")
+        route = self._routes.get(DestinationCatalog.normalize(city))
+        if route is None:
+            if self.fallback is None:
+                return []
+            return self.fallback.search_hotels(city, max_price, min_rating, amenities, sort, limit)
+        required = 0
+        for name in amenities:
+            if name not in self._amenity_bits:
+                return []  # no hotel offers an amenity the inventory has never seen
+            required |= self._amenity_bits[name]
+        if limit <= 0:
+            return []
+        table = self.hotels
+        start, stop = table.candidates(route, max_price)
+        
+        rating = table.columns["rating"][start:stop]
+        conditions = []
+        if min_rating is not None:
+            conditions.append(rating >= round(min_rating * 10))
+        if required:
+            conditions.append((table.columns["amenities"][start:stop] & required) == required)
+        mask = np.logical_and.reduce(conditions) if conditions else None
+        rank = -rating.astype(np.int32) if sort == "rating" else None
+        
+        columns = table.columns
+        return [
+            Hotel(self.hotel_names[i], int(columns["rating"][i]) / 10, int(table.price[i]),
+                  self._amenity_names(int(columns["amenities"][i])))
+            for i in table.top(start, stop, mask, rank, limit)
+        ]
+    
+    def _amenity_names(self, bits: int) -> Tuple[str, ...]:
+        return tuple(name for name, bit in self._amenity_bits.items() if bits & bit)
+
+
+@singleton
+def get_inventory() -> InventoryProvider:
+    """Return the process-wide offer inventory, loading it on first use"""
+    return LocalInventory.load()
+
+
+# Itinerary scheduling
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_matrix(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km between points given in degrees"""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _day_sizes(count: int, days: int) -> List[int]:
+    """Spread count items over days as evenly as possible, earlier days taking the remainder"""
+    base, extra = divmod(count, days)
+    return [base + 1] * extra + [base] * (days - extra)
+
+
+def _sweep_clusters(lat: np.ndarray, lon: np.ndarray, sizes: List[int]) -> List[np.ndarray]:
+    """Balanced geographic groups: sort by bearing around the centroid and cut into arcs"""
+    y = lat - lat.mean()
+    x = (lon - lon.mean()) * np.cos(np.radians(lat.mean()))
+    angles = np.arctan2(y, x)
+    order = np.argsort(angles, kind="stable")
+    
+    # Start the sweep just after the widest angular gap so no group straddles it
+    swept = angles[order]
+    gaps = np.diff(np.append(swept, swept[0] + 2 * np.pi))
+    order = np.roll(order, -((int(np.argmax(gaps)) + 1) % len(order)))
+    
+    bounds = np.cumsum([0] + sizes)
+    return [order[bounds[i]:bounds[i + 1]] for i in range(len(sizes))]
+
+
+def _order_route(indices: np.ndarray, distances: np.ndarray, max_moves: int = 200) -> np.ndarray:
+    """Short open walking route: nearest-neighbour tour refined with vectorized 2-opt"""
+    n = len(indices)
+    if n < 3:
+        return indices
+    
+    # A dummy node at zero distance from everything turns the open path into a tour with fixed ends
+    sub = np.zeros((n + 1, n + 1))
+    sub[:n, :n] = distances[np.ix_(indices, indices)]
+    
+    # Start from the most outlying place so the route sweeps across the group
+    start = int(np.argmax(sub[:n, :n].sum(axis=1)))
+    route = [start]
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    for _ in range(n - 1):
+        nearest = int(np.argmin(np.where(visited, np.inf, sub[route[-1], :n])))
+        route.append(nearest)
+        visited[nearest] = True
+    
+    path = np.array([n] + route + [n])
+    later = np.triu(np.ones((n, n), dtype=bool), k=1)
+    for _ in range(max_moves):
+        # Gain from reversing path[i:j+1] for every i < j at once; apply the best move
+        prev, cur, nxt = path[:-2], path[1:-1], path[2:]
+        delta = (sub[prev[:, None], cur[None, :]] + sub[cur[:, None], nxt[None, :]]
+                 - sub[prev, cur][:, None] - sub[cur, nxt][None, :])
+        delta[~later] = 0.0
+        i, j = np.unravel_index(int(np.argmin(delta)), delta.shape)
+        if delta[i, j] >= -1e-9:
+            break
+        path[i + 1:j + 2] = path[i + 1:j + 2][::-1]
+    return indices[path[1:-1]]
+
+
+def schedule_itinerary(places: List[Place], days: int) -> List[List[Place]]:
+    """Split places into per-day groups of nearby attractions, each ordered as a short route.
+    
+    Every place is scheduled and days get near-equal shares. Places without coordinates
+    keep their list order.
+    """
+    if days <= 0:
+        return []
+    sizes = _day_sizes(len(places), days)
+    if not places or not all(place.located for place in places):
+        bounds = np.cumsum([0] + sizes)
+        return [places[bounds[i]:bounds[i + 1]] for i in range(days)]
+    
+    lat = np.array([place.lat for place in places], dtype=float)
+    lon = np.array([place.lon for place in places], dtype=float)
+    distances = haversine_matrix(lat, lon)
+    return [
+        [places[i] for i in _order_route(group, distances)]
+        for group in _sweep_clusters(lat, lon, sizes)
+    ]
 
-OPENWEATHER_API_KEY = st.secrets["OPENWEATHER_API_KEY"]
 
 class TripPlannerAgent:
     """LLM-powered trip planning agent using MCP architecture"""
     
-    def __init__(self, gemini_api_key: str, weather_api_key: str):
+    def __init__(self, gemini_api_key: str, weather_api_key: str, parallel: bool = True, max_workers: int = 6,
+                 http_client: Optional[HttpClient] = None, geo_cache: Optional[GeoCache] = None,
+                 weather_cache: Optional[WeatherCache] = None, llm_cache: Optional[LLMCache] = None,
+                 combined: bool = False, catalog: Optional[DestinationCatalog] = None,
+                 climatology: Optional[Climatology] = None, weather_base_url: str = OPENWEATHER_BASE_URL,
+                 single_flight: Optional[SingleFlight] = None, gemini_limiter: Optional[UpstreamLimiter] = None,
+                 deadline: Optional[float] = PLAN_DEADLINE, hedge_after: Optional[float] = HEDGE_AFTER,
+                 plan_warehouse: Optional[PlanWarehouse] = None, inventory: Optional[InventoryProvider] = None):
         self.gemini_api_key = gemini_api_key
         self.weather_api_key = weather_api_key
+        self.weather_base_url = weather_base_url.rstrip("/")
+        self.http = http_client or get_http_client()
+        self.geo_cache = geo_cache or get_geo_cache()
+        self.weather_cache = weather_cache or get_weather_cache()
+        self.llm_cache = llm_cache or get_llm_cache()
+        self.catalog = catalog or get_catalog()
+        self.climatology = climatology or get_climatology()
+        # Identical concurrent weather/Gemini lookups from any session share one upstream call
+        self.single_flight = single_flight or get_single_flight()
+        self.gemini_limiter = gemini_limiter or get_gemini_limiter()
+        self.plan_warehouse = plan_warehouse or get_plan_warehouse()
+        self.inventory = inventory or get_inventory()
+        self.model_name = GEMINI_MODEL_NAME
+        # Run independent data/LLM stages concurrently; set False for sequential execution
+        self.parallel = parallel
+        self.max_workers = max_workers
+        # Ask Gemini for description and itinerary in one structured call
+        self.combined = combined
+        # Stages that miss their slice of the budget fall back; slow calls may be hedged
+        self.deadline = deadline
+        self.hedge_after = hedge_after
         if gemini_api_key:
-            self.model = genai.GenerativeModel('gemini-pro')
+            configure_gemini(gemini_api_key)
+            self.model = genai.GenerativeModel(self.model_name)
         else:
             self.model = None
     
-    def get_weather_data(self, city: str, country_code: str = "") -> Dict:
+    @traced("geocode")
+    def geocode(self, city: str, country_code: str = "") -> Optional[Dict]:
+        """Resolve a city to coordinates via the catalog, then the persistent geocoding cache"""
+        destination = self.catalog.lookup(city)
+        if destination is not None and destination.coordinates and country_code in ("", destination.country_code):
+            return destination.coordinates
+        
+        hit, coordinates = self.geo_cache.get(city, country_code)
+        if hit:
+            return coordinates
+        
+        geo_response = self.http.get(
+            f"{self.weather_base_url}/geo/1.0/direct",
+            params={"q": f"{city},{country_code}", "limit": 1, "appid": self.weather_api_key}
+        )
+        if geo_response.status_code != 200:
+            return None
+        if not geo_response.json():
+            # Remember misses briefly so typo'd cities don't hit the API on every click
+            self.geo_cache.put(city, country_code, None)
+            return None
+        
+        geo_data = geo_response.json()[0]
+        coordinates = {"lat": geo_data['lat'], "lon": geo_data['lon']}
+        self.geo_cache.put(city, country_code, coordinates)
+        return coordinates
+    
+    def _fetch_weather(self, endpoint: str, lat: float, lon: float) -> Optional[Dict]:
+        """Fetch one OpenWeather data/2.5 endpoint, returning None on a non-200 response"""
+        response = hedged(lambda: self.http.get(
+            f"{self.weather_base_url}/data/2.5/{endpoint}",
+            params={"lat": lat, "lon": lon, "appid": self.weather_api_key, "units": "metric"}
+        ), self.hedge_after)
+        if response.status_code != 200:
+            return None
+        return response.json()
+    
+    def _fetch_current(self, lat: float, lon: float) -> Optional[WeatherSummary]:
+        current = self._fetch_weather("weather", lat, lon)
+        if current is None:
+            return None
+        return WeatherSummary.from_current(current)
+    
+    def _fetch_daily_forecast(self, lat: float, lon: float) -> Optional[Tuple[DailyForecast, ...]]:
+        forecast = self._fetch_weather("forecast", lat, lon)
+        if forecast is None:
+            return None
+        return tuple(aggregate_forecast(forecast))
+    
+    def get_climate_summary(self, city: str, month: str) -> Optional[Dict]:
+        """Typical weather for the travel month from local climate normals"""
+        destination = self.catalog.lookup(city)
+        if destination is None:
+            return None
+        return self.climatology.summary(destination.name, month)
+    
+    # A fixed label: the error text is for the page, and spans end up in logs and the timing panel
+    @traced("weather", error_of=lambda result: None if result.available else "unavailable")
+    def get_weather_data(self, city: str, country_code: str = "") -> WeatherSummary:
+        """Fetch current weather and forecast, sharing one lookup among concurrent callers"""
+        key = ("weather", self.weather_base_url, self.weather_api_key, city.strip().lower(), country_code.upper())
+        return self.single_flight.do(key, lambda: self._load_weather_data(city, country_code))
+    
+    def _load_weather_data(self, city: str, country_code: str) -> WeatherSummary:
         """Fetch current weather and forecast using OpenWeather API"""
         try:
             # Get coordinates first
-            geo_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city},{country_code}&limit=1&appid={self.weather_api_key}"
-            geo_response = requests.get(geo_url)
+            coordinates = self.geocode(city, country_code)
+            if coordinates is None:
+                return WeatherSummary.unavailable("City not found")
+            
+            lat, lon = coordinates["lat"], coordinates["lon"]
+            
+            # Get current weather, cached as the few fields the plan shows rather than the raw payload
+            current = self.weather_cache.get("current", lat, lon, lambda: self._fetch_current(lat, lon))
+            
+            # Get forecast, cached as per-day summaries rather than the raw 3-hourly payload
+            forecast = self.weather_cache.get("forecast", lat, lon, lambda: self._fetch_daily_forecast(lat, lon))
             
-            if geo_response.status_code != 200 or not geo_response.json():
-                return {"error": "City not found"}
+            if current is not None and forecast is not None:
+                return current.replace(daily=forecast)
+            else:
+                return WeatherSummary.unavailable("Failed to fetch weather data")
+        except Exception as e:
+            # The exception text can carry the request URL and with it the API key
+            return WeatherSummary.unavailable(f"Weather API error ({type(e).__name__})")
+    
+    @traced("places")
+    def get_places_data(self, city: str, place_type: str = "tourist_attraction") -> List[Place]:
+        """Simulate getting places data (would use Google Places API in production)"""
+        destination = self.catalog.lookup(city)
+        if destination is not None and destination.places:
+            return destination.places_list()
+        
+        # For custom cities not in database, return generic attractions
+        # In production, this would call Google Places API
+        return self._placeholder_places(city)
+    
+    @staticmethod
+    def _placeholder_places(city: str) -> List[Place]:
+        return [
+            Place(f"{city} Main Square", "landmark", 4.5),
+            Place(f"{city} Museum", "museum", 4.4),
+            Place(f"{city} Old Town", "neighborhood", 4.6),
+            Place(f"{city} Cathedral", "church", 4.5),
+            Place(f"{city} Market", "market", 4.3)
+        ]
+    
+    def _inventory_city(self, city: str) -> str:
+        """Catalog name for a city, so aliases and typos find its offers"""
+        destination = self.catalog.lookup(city)
+        return destination.name if destination is not None else city
+    
+    @traced("flights")
+    def get_flight_options(self, destination: str, travel_month: str) -> List[Flight]:
+        """Cheapest flights into the destination from the offer inventory"""
+        return self.inventory.search_flights(self._inventory_city(destination), limit=FLIGHT_RESULTS)
+    
+    @traced("hotels")
+    def get_hotel_options(self, city: str) -> List[Hotel]:
+        """Best-rated hotels in the city from the offer inventory, cheaper first among equals"""
+        return self.inventory.search_hotels(self._inventory_city(city), sort="rating", limit=HOTEL_RESULTS)
+    
+    def _generate(self, prompt: str) -> str:
+        """Call Gemini through the response cache"""
+        cached = self.llm_cache.get(self.model_name, prompt)
+        if cached is not None:
+            return cached
+        return self._call_gemini(prompt, cache=True)
+    
+    def _call_gemini(self, prompt: str, cache: bool = False) -> str:
+        """Make one Gemini call per prompt among concurrent callers, optionally caching the text"""
+        def attempt() -> Any:
+            with self.gemini_limiter.slot(self._token_estimate(prompt)) as quota, span("gemini") as info:
+                try:
+                    response = self.model.generate_content(prompt, request_options={"timeout": GEMINI_TIMEOUT})
+                except Exception as e:
+                    quota["throttled"] = is_rate_limited(e)
+                    raise
+                quota["tokens"] = self._record_usage(response, info)
+                return response
+        
+        def call() -> str:
+            for retry in range(GEMINI_MAX_RETRIES + 1):
+                try:
+                    text = hedged(attempt, self.hedge_after).text
+                    break
+                except Exception as e:
+                    # Throttled calls wait for quota again; anything else fails fast
+                    if not is_rate_limited(e) or retry == GEMINI_MAX_RETRIES:
+                        raise
+            if cache and text:
+                self.llm_cache.put(self.model_name, prompt, text)
+            return text
+        return self.single_flight.do(("gemini", self.model_name, prompt), call)
+    
+    @staticmethod
+    def _token_estimate(prompt: str) -> int:
+        """Tokens to reserve against the TPM budget before the call reports real usage"""
+        return len(prompt) // 4 + GEMINI_OUTPUT_TOKEN_ESTIMATE
+    
+    @staticmethod
+    def _record_usage(response, info: Dict) -> Optional[int]:
+        """Count Gemini prompt/completion tokens when the response reports usage, returning the total"""
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return None
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        METRICS.inc("trip_planner_llm_tokens_total", prompt_tokens, kind="prompt")
+        METRICS.inc("trip_planner_llm_tokens_total", completion_tokens, kind="completion")
+        info["prompt_tokens"] = prompt_tokens
+        info["completion_tokens"] = completion_tokens
+        return prompt_tokens + completion_tokens
+    
+    def _generate_stream(self, prompt: str) -> Iterator[str]:
+        """Stream Gemini output chunk by chunk, caching the assembled response"""
+        started = time.perf_counter()
+        cached = self.llm_cache.get(self.model_name, prompt)
+        if cached is not None:
+            yield cached
+            return
+        yield from self.single_flight.stream(
+            ("gemini_stream", self.model_name, prompt), lambda: self._stream_gemini(prompt, started)
+        )
+    
+    def _stream_gemini(self, prompt: str, started: float) -> Iterator[str]:
+        """Run one streamed Gemini call and cache the assembled response"""
+        parts = []
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            with self.gemini_limiter.slot(self._token_estimate(prompt)) as quota, span("gemini_stream") as info:
+                try:
+                    response = self.model.generate_content(prompt, stream=True,
+                                                           request_options={"timeout": GEMINI_TIMEOUT})
+                    for chunk in response:
+                        if chunk.text:
+                            if not parts:
+                                info["first_chunk_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                            parts.append(chunk.text)
+                            yield chunk.text
+                except Exception as e:
+                    if not is_rate_limited(e):
+                        raise
+                    quota["throttled"] = True
+                    # Output already shown can't be retracted, so only retry before the first chunk
+                    if parts or attempt == GEMINI_MAX_RETRIES:
+                        raise
+                    info["error"] = "rate limited"
+                    continue
+                quota["tokens"] = self._record_usage(response, info)
+            break
+        text = "".join(parts)
+        if text:
+            self.llm_cache.put(self.model_name, prompt, text)
+    
+    def _stream_or_fallback(self, build_prompt: Callable[[], str], fallback: str) -> Iterator[str]:
+        """Stream a prompt, yielding the fallback text if it fails before producing output.
+        
+        A failure after some output is re-raised, so the caller can mark the section incomplete.
+        """
+        emitted = False
+        try:
+            for chunk in self._generate_stream(build_prompt()):
+                emitted = True
+                yield chunk
+        except Exception:
+            if emitted:
+                raise
+            yield fallback
+    
+    @traced("city_description")
+    def generate_city_description(self, city: str, duration: int) -> str:
+        """Generate cultural and historical description using Gemini"""
+        if not self.model:
+            return self._fallback_city_description(city)
+        
+        try:
+            return self._generate(self._city_description_prompt(city, duration))
+        except Exception as e:
+            return self._city_description_error_text(city)
+    
+    def _fallback_city_description(self, city: str) -> str:
+        destination = self.catalog.lookup(city)
+        if destination is not None and destination.description:
+            return destination.description
+        return f"{city} is a fascinating destination with rich cultural heritage and historical significance. This vibrant city offers unique experiences, local traditions, and memorable attractions that showcase its distinctive character. Visitors can explore historical sites, enjoy local cuisine, and immerse themselves in the authentic culture of this remarkable destination."
+    
+    def _city_description_prompt(self, city: str, duration: int) -> str:
+        return f"""Write a concise 1-paragraph description (100-120 words) about {city}'s cultural and historic significance. 
+            Focus on what makes it unique, its historical importance, architectural heritage, and cultural attractions. 
+            Make it engaging and informative for travelers planning a {duration}-day trip."""
+    
+    def _city_description_error_text(self, city: str) -> str:
+        return f"{city} is a remarkable destination with rich cultural and historical heritage worth exploring. This city offers unique attractions, local experiences, and memorable moments for travelers."
+    
+    def stream_city_description(self, city: str, duration: int) -> Iterator[str]:
+        """Yield the city description in chunks as Gemini produces them"""
+        if not self.model:
+            yield self.generate_city_description(city, duration)
+            return
+        yield from self._stream_or_fallback(
+            lambda: self._city_description_prompt(city, duration),
+            self._city_description_error_text(city)
+        )
+    
+    @traced("trip_plan")
+    def generate_trip_plan(self, city: str, duration: int, weather_data: Optional[WeatherSummary], places: List[Place],
+                           climate: Optional[Dict] = None) -> str:
+        """Generate detailed day-by-day trip itinerary using Gemini"""
+        if not self.model:
+            return self._fallback_trip_plan(city, duration, places)
+        
+        try:
+            return self._generate(self._trip_plan_prompt(city, duration, weather_data, places, climate))
+        except Exception as e:
+            return TRIP_PLAN_ERROR_TEXT
+    
+    @staticmethod
+    def _fallback_trip_plan(city: str, duration: int, places: List[Place]) -> str:
+        """Day-by-day plan built from the scheduled places alone"""
+        plan = f"**Day-by-Day Itinerary for {city}**\n\n"
+        for day, day_places in enumerate(schedule_itinerary(places, duration), 1):
+            plan += f"**Day {day}:**\n"
+            for place in day_places:
+                plan += f"- Visit {place.name} ({place.type})\n"
+            if not day_places:
+                plan += f"- Explore {city} at your own pace: local neighborhoods, markets and cuisine\n"
+            plan += "\n"
+        return plan
+    
+    def _weather_context(self, weather_data: Optional[WeatherSummary], climate: Optional[Dict] = None) -> str:
+        context = ""
+        if weather_data is not None and weather_data.available:
+            # Bucket the temperature so near-identical prompts share a cache entry
+            temp = int(WEATHER_TEMP_BUCKET * round(weather_data.temp / WEATHER_TEMP_BUCKET))
+            context += f"Current weather: {temp}°C, {weather_data.description}. "
+        if climate:
+            context += (f"Typical {climate['month']} weather: {climate['summary'].lower()}, highs around "
+                        f"{climate['avg_high_c']:.0f}°C and lows around {climate['avg_low_c']:.0f}°C. ")
+        return context
+    
+    def _places_context(self, places: List[Place], duration: int) -> str:
+        """Attractions for the prompt, pre-grouped into days of nearby places when coordinates are known"""
+        schedule = schedule_itinerary(places[:8], duration)
+        places_list = ", ".join(place.name for day in schedule for place in day)
+        context = f"Include these attractions: {places_list}"
+        if all(place.located for place in places[:8]):
+            grouping = "; ".join(
+                f"Day {day}: {', '.join(place.name for place in day_places)}"
+                for day, day_places in enumerate(schedule, 1) if day_places
+            )
+            context += f"\n            Group them by day to keep travel short: {grouping}"
+        return context
+    
+    def _trip_plan_prompt(self, city: str, duration: int, weather_data: Optional[WeatherSummary], places: List[Place],
+                          climate: Optional[Dict] = None) -> str:
+        weather_context = self._weather_context(weather_data, climate)
+        places_context = self._places_context(places, duration)
+        
+        return f"""Create a detailed {duration}-day trip itinerary for {city}. 
+            {weather_context}
+            {places_context}
             
-            geo_data = geo_response.json()[0]
-            lat, lon = geo_data['lat'], geo_data['lon']
+            Format the response as:
+            **Day 1:**
+            - Morning: [activity]
+            - Afternoon: [activity]
+            - Evening: [activity]
             
-            # Get current weather
-            weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={self.weather_api_key}&units=metric"
-            weather_response = requests.get(weather_url)
+            Make it practical, well-paced, and engaging. Include timing suggestions and brief descriptions."""
+    
+    def stream_trip_plan(self, city: str, duration: int, weather_data: Optional[WeatherSummary], places: List[Place],
+                         climate: Optional[Dict] = None) -> Iterator[str]:
+        """Yield the day-by-day itinerary in chunks as Gemini produces them"""
+        if not self.model:
+            yield self.generate_trip_plan(city, duration, weather_data, places, climate)
+            return
+        yield from self._stream_or_fallback(
+            lambda: self._trip_plan_prompt(city, duration, weather_data, places, climate),
+            TRIP_PLAN_ERROR_TEXT
+        )
+    
+    def _combined_prompt(self, city: str, duration: int, weather_data: Optional[WeatherSummary], places: List[Place],
+                         climate: Optional[Dict] = None) -> str:
+        weather_context = self._weather_context(weather_data, climate)
+        places_context = self._places_context(places, duration)
+        
+        return f"""You are planning a {duration}-day trip to {city}. {weather_context}
+            {places_context}
             
-            # Get forecast
-            forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={self.weather_api_key}&units=metric"
-            forecast_response = requests.get(forecast_url)
+            Respond with only a JSON object, no markdown fences, in exactly this shape:
+            {{"city_description": "<one paragraph, 100-120 words, on {city}'s cultural and historic significance>",
+              "days": [{{"day": 1, "morning": "<activity>", "afternoon": "<activity>", "evening": "<activity>"}}]}}
             
-            if weather_response.status_code == 200 and forecast_response.status_code == 200:
-                return {
-                    "current": weather_response.json(),
-                    "forecast": forecast_response.json(),
-                    "coordinates": {"lat": lat, "lon": lon}
-                }
-            else:
-                return {"error": "Failed to fetch weather data"}
-        except Exception as e:
-            return {"error": f"Weather API error: {str(e)}"}
+            "days" must contain exactly {duration} entries, numbered from 1. Make the itinerary practical,
+            well-paced, and engaging, with timing suggestions and brief descriptions in each activity."""
     
-    def get_places_data(self, city: str, place_type: str = "tourist_attraction") -> List[Dict]:
-        """Simulate getting places data (would use Google Places API in production)"""
-        # Extended database with more cities
-        places_db = {
-            "Tokyo": [
-                {"name": "Senso-ji Temple", "type": "temple", "rating": 4.5},
-                {"name": "Tokyo Skytree", "type": "landmark", "rating": 4.7},
-                {"name": "Meiji Shrine", "type": "shrine", "rating": 4.6},
-                {"name": "Shibuya Crossing", "type": "landmark", "rating": 4.4},
-                {"name": "Tsukiji Outer Market", "type": "market", "rating": 4.5}
-            ],
-            "Udaipur": [
-                {"name": "City Palace", "type": "palace", "rating": 4.7},
-                {"name": "Lake Pichola", "type": "lake", "rating": 4.6},
-                {"name": "Jag Mandir", "type": "palace", "rating": 4.5},
-                {"name": "Saheliyon Ki Bari", "type": "garden", "rating": 4.4},
-                {"name": "Bagore Ki Haveli", "type": "museum", "rating": 4.3}
-            ],
-            "Paris": [
-                {"name": "Eiffel Tower", "type": "landmark", "rating": 4.7},
-                {"name": "Louvre Museum", "type": "museum", "rating": 4.8},
-                {"name": "Notre-Dame Cathedral", "type": "church", "rating": 4.6},
-                {"name": "Arc de Triomphe", "type": "monument", "rating": 4.5},
-                {"name": "Sacré-Cœur", "type": "church", "rating": 4.6}
-            ],
-            "London": [
-                {"name": "Tower of London", "type": "castle", "rating": 4.6},
-                {"name": "British Museum", "type": "museum", "rating": 4.7},
-                {"name": "Buckingham Palace", "type": "palace", "rating": 4.5},
-                {"name": "London Eye", "type": "landmark", "rating": 4.4},
-                {"name": "Westminster Abbey", "type": "church", "rating": 4.7}
-            ],
-            "New York": [
-                {"name": "Statue of Liberty", "type": "landmark", "rating": 4.7},
-                {"name": "Central Park", "type": "park", "rating": 4.8},
-                {"name": "Empire State Building", "type": "landmark", "rating": 4.6},
-                {"name": "Times Square", "type": "landmark", "rating": 4.5},
-                {"name": "Metropolitan Museum", "type": "museum", "rating": 4.8}
-            ],
-            "Dubai": [
-                {"name": "Burj Khalifa", "type": "landmark", "rating": 4.8},
-                {"name": "Dubai Mall", "type": "shopping", "rating": 4.7},
-                {"name": "Palm Jumeirah", "type": "landmark", "rating": 4.6},
-                {"name": "Dubai Marina", "type": "waterfront", "rating": 4.5},
-                {"name": "Gold Souk", "type": "market", "rating": 4.4}
-            ],
-            "Singapore": [
-                {"name": "Marina Bay Sands", "type": "landmark", "rating": 4.7},
-                {"name": "Gardens by the Bay", "type": "garden", "rating": 4.8},
-                {"name": "Sentosa Island", "type": "island", "rating": 4.6},
-                {"name": "Merlion Park", "type": "park", "rating": 4.4},
-                {"name": "Chinatown", "type": "neighborhood", "rating": 4.5}
-            ],
-            "Bangkok": [
-                {"name": "Grand Palace", "type": "palace", "rating": 4.7},
-                {"name": "Wat Pho", "type": "temple", "rating": 4.6},
-                {"name": "Wat Arun", "type": "temple", "rating": 4.6},
-                {"name": "Chatuchak Market", "type": "market", "rating": 4.5},
-                {"name": "Khao San Road", "type": "street", "rating": 4.3}
-            ],
-            "Rome": [
-                {"name": "Colosseum", "type": "landmark", "rating": 4.8},
-                {"name": "Vatican Museums", "type": "museum", "rating": 4.7},
-                {"name": "Trevi Fountain", "type": "fountain", "rating": 4.6},
-                {"name": "Pantheon", "type": "monument", "rating": 4.7},
-                {"name": "Spanish Steps", "type": "landmark", "rating": 4.5}
-            ],
-            "Barcelona": [
-                {"name": "Sagrada Familia", "type": "church", "rating": 4.8},
-                {"name": "Park Güell", "type": "park", "rating": 4.7},
-                {"name": "La Rambla", "type": "street", "rating": 4.5},
-                {"name": "Casa Batlló", "type": "architecture", "rating": 4.6},
-                {"name": "Gothic Quarter", "type": "neighborhood", "rating": 4.6}
-            ]
-        }
+    @staticmethod
+    def _parse_combined(text: str, duration: int) -> Optional[Dict]:
+        """Validate a combined response, returning None if it is not the expected shape"""
+        text = text.strip()
+        if text.startswith("```"):
+            text = text.strip("`")
+            text = text[text.index("\n") + 1:] if "\n" in text else ""
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
         
-        # If city is in database, return those places
-        if city in places_db:
-            return places_db[city]
+        description = data.get("city_description")
+        days = data.get("days")
+        if not isinstance(description, str) or not description.strip():
+            return None
+        if not isinstance(days, list) or len(days) != duration:
+            return None
         
-        # For custom cities not in database, return generic attractions
-        # In production, this would call Google Places API
-        return [
-            {"name": f"{city} Main Square", "type": "landmark", "rating": 4.5},
-            {"name": f"{city} Museum", "type": "museum", "rating": 4.4},
-            {"name": f"{city} Old Town", "type": "neighborhood", "rating": 4.6},
-            {"name": f"{city} Cathedral", "type": "church", "rating": 4.5},
-            {"name": f"{city} Market", "type": "market", "rating": 4.3}
-        ]
+        parsed_days = []
+        for number, day in enumerate(days, 1):
+            if not isinstance(day, dict):
+                return None
+            slots = {slot: day.get(slot) for slot in ("morning", "afternoon", "evening")}
+            if not all(isinstance(value, str) and value.strip() for value in slots.values()):
+                return None
+            parsed_days.append({"day": number, **{slot: value.strip() for slot, value in slots.items()}})
+        return {"city_description": description.strip(), "days": parsed_days}
     
-    def get_flight_options(self, destination: str, travel_month: str) -> List[Dict]:
-        """Simulate flight search (would use Skyscanner API in production)"""
-        # Mock flight data
-        flights = [
-            {
-                "airline": "Air India",
-                "departure": "DEL",
-                "arrival": destination[:3].upper(),
-                "duration": "2h 30m" if destination == "Udaipur" else "6h 45m",
-                "price": "₹8,500" if destination == "Udaipur" else "₹18,500",
-                "stops": "Non-stop"
-            },
-            {
-                "airline": "IndiGo",
-                "departure": "BLR",
-                "arrival": destination[:3].upper(),
-                "duration": "2h 15m" if destination == "Udaipur" else "7h 20m",
-                "price": "₹7,200" if destination == "Udaipur" else "₹22,000",
-                "stops": "Non-stop" if destination == "Udaipur" else "1 stop"
-            }
-        ]
-        return flights
-    
-    def get_hotel_options(self, city: str) -> List[Dict]:
-        """Simulate hotel search (would use hotel booking API in production)"""
-        # Mock hotel data
-        hotels = [
-            {
-                "name": f"{city} Grand Hotel",
-                "rating": 4.5,
-                "price_per_night": "₹5,500" if city == "Udaipur" else "₹8,500",
-                "amenities": ["WiFi", "Breakfast", "Pool", "Spa"]
-            },
-            {
-                "name": f"Budget Inn {city}",
-                "rating": 4.0,
-                "price_per_night": "₹2,800" if city == "Udaipur" else "₹4,200",
-                "amenities": ["WiFi", "Breakfast"]
-            },
-            {
-                "name": f"Luxury Palace {city}",
-                "rating": 5.0,
-                "price_per_night": "₹12,000" if city == "Udaipur" else "₹18,000",
-                "amenities": ["WiFi", "Breakfast", "Pool", "Spa", "Restaurant", "Gym"]
-            }
-        ]
-        return hotels
+    @staticmethod
+    def format_itinerary_days(days: List[Dict]) -> str:
+        """Render structured days in the same markdown layout as the itinerary prompt"""
+        plan = ""
+        for day in days:
+            plan += f"**Day {day['day']}:**\n"
+            plan += f"- Morning: {day['morning']}\n"
+            plan += f"- Afternoon: {day['afternoon']}\n"
+            plan += f"- Evening: {day['evening']}\n\n"
+        return plan
     
-    def generate_city_description(self, city: str, duration: int) -> str:
-        """Generate cultural and historical description using Gemini"""
+    @traced("combined_generation", error_of=lambda result: None if result is not None else "fallback")
+    def generate_combined(self, city: str, duration: int, weather_data: Optional[WeatherSummary], places: List[Place],
+                          climate: Optional[Dict] = None) -> Optional[Dict]:
+        """Generate description and itinerary in one structured Gemini call.
+        
+        Returns {"city_description", "trip_plan", "itinerary_days"}, or None when there is no
+        model or the response can't be parsed, so callers fall back to the two-call path.
+        """
         if not self.model:
-            # Expanded fallback descriptions for more cities
-            descriptions = {
-                "Tokyo": "Tokyo, Japan's bustling capital, seamlessly blends ancient tradition with cutting-edge modernity. Home to historic temples like Senso-ji and Meiji Shrine alongside futuristic skyscrapers, Tokyo offers a unique cultural experience. The city's rich heritage spans from samurai history to contemporary pop culture, making it a fascinating destination where centuries-old customs coexist with technological innovation. From traditional tea ceremonies to world-class cuisine and vibrant neighborhoods like Shibuya and Harajuku, Tokyo captivates visitors with its dynamic energy and cultural depth.",
-                "Udaipur": "Udaipur, known as the 'City of Lakes' and the 'Venice of the East,' is a jewel of Rajasthan's royal heritage. Founded in 1559 by Maharana Udai Singh II, this enchanting city showcases magnificent palaces, pristine lakes, and stunning Rajput architecture. The City Palace complex stands as a testament to the valor and artistic sensibilities of the Mewar dynasty. With its romantic lakeside setting, ornate havelis, and vibrant bazaars, Udaipur preserves centuries of Indian culture and craftsmanship, offering visitors a glimpse into the opulent lifestyle of Rajasthan's maharajas.",
-                "Paris": "Paris, the 'City of Light,' stands as a timeless symbol of art, culture, and romance. With its iconic landmarks like the Eiffel Tower, Louvre Museum, and Notre-Dame Cathedral, Paris showcases centuries of architectural brilliance and artistic achievement. The city's charming boulevards, world-class museums, and exquisite cuisine have made it a cultural epicenter. From the bohemian streets of Montmartre to the elegant Champs-Élysées, Paris offers a perfect blend of historical grandeur and contemporary sophistication.",
-                "London": "London, the vibrant capital of the United Kingdom, is a city where royal heritage meets modern multiculturalism. With over 2000 years of history, London boasts iconic landmarks like the Tower of London, Buckingham Palace, and Westminster Abbey. The city's world-renowned museums, theaters, and diverse neighborhoods reflect its status as a global cultural hub. From traditional afternoon tea to cutting-edge fashion and finance, London seamlessly combines historic traditions with contemporary innovation.",
-                "New York": "New York City, the 'City that Never Sleeps,' is a dynamic metropolis that embodies the American dream. This global center of culture, finance, and entertainment features iconic landmarks like the Statue of Liberty, Empire State Building, and Central Park. The city's diverse neighborhoods, from Manhattan's skyscrapers to Brooklyn's artistic enclaves, showcase an unparalleled cultural mosaic. World-class museums, Broadway theaters, and culinary excellence make New York an essential destination for any traveler.",
-                "Dubai": "Dubai, the jewel of the UAE, is a stunning fusion of traditional Arabian culture and futuristic innovation. Rising from desert sands, this city showcases architectural marvels like the Burj Khalifa and Palm Jumeirah. Dubai's luxury shopping malls, pristine beaches, and traditional souks offer contrasting experiences. The city's rapid transformation from a fishing village to a global hub exemplifies ambition and vision, making it a must-visit destination for those seeking luxury and cultural discovery.",
-                "Singapore": "Singapore, the 'Lion City,' is a remarkable island nation that combines efficient urban planning with rich cultural diversity. This modern city-state features stunning architecture like Marina Bay Sands and Gardens by the Bay, while preserving its multicultural heritage in neighborhoods like Chinatown and Little India. Singapore's blend of Asian traditions, colonial history, and futuristic development creates a unique Southeast Asian experience, complemented by world-class cuisine and shopping.",
-                "Rome": "Rome, the 'Eternal City,' stands as a living museum of Western civilization with over 2,500 years of history. From the ancient Colosseum and Roman Forum to the artistic treasures of the Vatican, Rome showcases the evolution of art, architecture, and culture. The city's baroque fountains, Renaissance palaces, and charming piazzas create an atmosphere where every corner tells a story. Roman cuisine, fashion, and the dolce vita lifestyle add to the city's timeless appeal."
-            }
-            return descriptions.get(city, f"{city} is a fascinating destination with rich cultural heritage and historical significance. This vibrant city offers unique experiences, local traditions, and memorable attractions that showcase its distinctive character. Visitors can explore historical sites, enjoy local cuisine, and immerse themselves in the authentic culture of this remarkable destination.")
+            return None
         
         try:
-            prompt = f"""Write a concise 1-paragraph description (100-120 words) about {city}'s cultural and historic significance. 
-            Focus on what makes it unique, its historical importance, architectural heritage, and cultural attractions. 
-            Make it engaging and informative for travelers planning a {duration}-day trip."""
+            prompt = self._combined_prompt(city, duration, weather_data, places, climate)
+            cached = self.llm_cache.get(self.model_name, prompt)
+            if cached is not None:
+                text = cached
+            else:
+                text = self._call_gemini(prompt)
+            parsed = self._parse_combined(text, duration)
+            if parsed is None:
+                return None
+            if cached is None:
+                # Only well-formed responses are worth caching
+                self.llm_cache.put(self.model_name, prompt, text)
+        except Exception:
+            return None
+        
+        return {
+            "city_description": parsed["city_description"],
+            "trip_plan": self.format_itinerary_days(parsed["days"]),
+            "itinerary_days": parsed["days"],
+        }
+    
+    def country_code(self, city: str) -> str:
+        """Country code hint for the weather API, or "" to let OpenWeather auto-detect"""
+        destination = self.catalog.lookup(city)
+        return destination.country_code if destination is not None else ""
+    
+    def fallback_section(self, section: str, city: str, duration: int, places: Optional[List[Place]] = None) -> Any:
+        """Stand-in content for a section that missed its deadline"""
+        if section == "weather":
+            return WeatherSummary.unavailable("Weather data is taking longer than usual")
+        if section == "places":
+            return self._placeholder_places(city)
+        if section in ("flights", "hotels"):
+            return []
+        if section == "city_description":
+            return self._fallback_city_description(city)
+        if section == "trip_plan":
+            return self._fallback_trip_plan(city, duration, places or self._placeholder_places(city))
+        return None
+    
+    def stored_plan(self, city: str, duration: int, month: str) -> Optional[TripPlan]:
+        """Precomputed sections for a catalog city, or None"""
+        destination = self.catalog.lookup(city)
+        if destination is None:
+            return None
+        return self.plan_warehouse.get(destination.name, duration, month)
+    
+    @staticmethod
+    def _run_within(budget: PlanBudget, section: str, fn: Callable, *args) -> Any:
+        """Run fn on a helper thread, raising FutureTimeout if it misses the section's deadline"""
+        if budget.total is None:
+            return fn(*args)
+        pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            return submit_in_context(pool, fn, *args).result(timeout=budget.remaining(section))
+        finally:
+            pool.shutdown(wait=False)
+    
+    @staticmethod
+    def _stream_within(budget: PlanBudget, section: str, chunks: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """Relay chunks from a helper thread, raising FutureTimeout once the section misses its deadline.
+        
+        A stream already under way keeps going past the deadline while chunks keep arriving.
+        """
+        if budget.total is None:
+            yield from chunks()
+            return
+        relay: "queue.Queue[Any]" = queue.Queue()
+        end = object()
+        
+        def pump():
+            try:
+                for chunk in chunks():
+                    relay.put(chunk)
+            finally:
+                relay.put(end)
+        
+        pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = submit_in_context(pool, pump)
+            last_chunk = None
+            while True:
+                timeout = budget.remaining(section)
+                if last_chunk is not None:
+                    timeout = max(timeout, last_chunk + STREAM_IDLE_TIMEOUT - time.monotonic())
+                try:
+                    chunk = relay.get(timeout=timeout)
+                except queue.Empty:
+                    raise FutureTimeout()
+                if chunk is end:
+                    future.result()  # surface producer errors
+                    return
+                last_chunk = time.monotonic()
+                yield chunk
+        finally:
+            pool.shutdown(wait=False)
+    
+    @traced("plan_trip")
+    def plan_trip(self, city: str, duration: int, month: str) -> TripPlan:
+        """Main trip planning function - orchestrates all components.
+        
+        Each stage gets a slice of the deadline budget; a stage that misses it is replaced by
+        fallback content and listed in the plan's degraded sections, in sequential mode as well.
+        """
+        
+        # Try to get country code from mapping, or let OpenWeather auto-detect
+        country_code = self.country_code(city)
+        climate = self.get_climate_summary(city, month)
+        budget = PlanBudget(self.deadline)
+        degraded: List[str] = []
+        
+        def fallback(section: str, places: Optional[List[Place]] = None) -> Any:
+            degraded.append(section)
+            METRICS.inc("trip_planner_degraded_sections_total", section=section)
+            return self.fallback_section(section, city, duration, places)
+        
+        stored = self.stored_plan(city, duration, month)
+        if stored is not None:
+            # Precomputed plan: only the weather is fetched live
+            try:
+                weather_data = self._run_within(budget, "weather", self.get_weather_data, city, country_code)
+            except FutureTimeout:
+                weather_data = fallback("weather")
+            return stored.replace(weather=weather_data, climate=climate, duration=duration, month=month,
+                                  degraded=degraded)
+        
+        if self.parallel:
+            # Shut down without waiting so a stage past its deadline can't hold the response;
+            # it finishes in the background and warms the caches for the next request
+            pool = ThreadPoolExecutor(max_workers=self.max_workers)
             
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return f"{city} is a remarkable destination with rich cultural and historical heritage worth exploring. This city offers unique attractions, local experiences, and memorable moments for travelers."
+            def settle(section: str, future, places: Optional[List[Place]] = None) -> Any:
+                if future is None:
+                    return fallback(section, places)
+                try:
+                    return future.result(timeout=budget.remaining(section))
+                except FutureTimeout:
+                    return fallback(section, places)
+            
+            try:
+                # Independent stages run concurrently
+                weather_future = submit_in_context(pool, self.get_weather_data, city, country_code)
+                places_future = submit_in_context(pool, self.get_places_data, city)
+                flights_future = submit_in_context(pool, self.get_flight_options, city, month)
+                hotels_future = submit_in_context(pool, self.get_hotel_options, city)
+                description_future = None
+                if not self.combined:
+                    description_future = submit_in_context(pool, self.generate_city_description, city, duration)
+                
+                # The itinerary prompt only waits on weather and places
+                weather_data = settle("weather", weather_future)
+                places = settle("places", places_future)
+                combined = None
+                if self.combined:
+                    combined_future = submit_in_context(
+                        pool, self.generate_combined, city, duration, weather_data, places, climate
+                    )
+                    try:
+                        combined = combined_future.result(timeout=budget.remaining("trip_plan"))
+                    except FutureTimeout:
+                        pass
+                if combined is None:
+                    if description_future is None and not budget.expired("city_description"):
+                        description_future = submit_in_context(pool, self.generate_city_description, city, duration)
+                    trip_plan_future = None
+                    if not budget.expired("trip_plan"):
+                        trip_plan_future = submit_in_context(
+                            pool, self.generate_trip_plan, city, duration, weather_data, places, climate
+                        )
+                    trip_plan = settle("trip_plan", trip_plan_future, places)
+                    city_description = settle("city_description", description_future)
+                
+                flights = settle("flights", flights_future)
+                hotels = settle("hotels", hotels_future)
+            finally:
+                pool.shutdown(wait=False)
+        else:
+            def run(section: str, fn: Callable, *args, places: Optional[List[Place]] = None) -> Any:
+                if budget.expired(section):
+                    return fallback(section, places)
+                try:
+                    return self._run_within(budget, section, fn, *args)
+                except FutureTimeout:
+                    return fallback(section, places)
+            
+            # Gather all data; the catalog-backed stages are local
+            weather_data = run("weather", self.get_weather_data, city, country_code)
+            places = self.get_places_data(city)
+            flights = self.get_flight_options(city, month)
+            hotels = self.get_hotel_options(city)
+            
+            # Generate LLM-powered content
+            combined = None
+            if self.combined and not budget.expired("trip_plan"):
+                try:
+                    combined = self._run_within(budget, "trip_plan", self.generate_combined,
+                                                city, duration, weather_data, places, climate)
+                except FutureTimeout:
+                    pass
+            if combined is None:
+                city_description = run("city_description", self.generate_city_description, city, duration)
+                trip_plan = run("trip_plan", self.generate_trip_plan, city, duration, weather_data, places, climate,
+                                places=places)
+        
+        if combined is not None:
+            city_description = combined["city_description"]
+            trip_plan = combined["trip_plan"]
+        
+        return TripPlan(
+            city_description=city_description,
+            weather=weather_data,
+            climate=climate,
+            places=places,
+            flights=flights,
+            hotels=hotels,
+            trip_plan=trip_plan,
+            itinerary_days=combined["itinerary_days"] if combined else None,
+            duration=duration,
+            month=month,
+            degraded=degraded
+        )
     
-    def generate_trip_plan(self, city: str, duration: int, weather_data: Dict, places: List[Dict]) -> str:
-        """Generate detailed day-by-day trip itinerary using Gemini"""
-        if not self.model:
-            # Fallback itinerary
-            plan = f"**Day-by-Day Itinerary for {city}**\n\n"
-            for day in range(1, duration + 1):
-                plan += f"**Day {day}:**\n"
-                if day <= len(places):
-                    start_idx = (day - 1) * 2
-                    day_places = places[start_idx:start_idx + 2]
-                    for place in day_places:
-                        plan += f"- Visit {place['name']} ({place['type']})\n"
-                plan += "\n"
-            return plan
+    def plan_trip_stream(self, city: str, duration: int, month: str) -> Iterator[Tuple[str, Any]]:
+        """Yield (section, value) events as each part of the plan becomes ready.
+        
+        "weather", "places", "flights" and "hotels" arrive whole; "city_description" and
+        "trip_plan" arrive as successive text chunks. In combined mode a successful structured
+        call sends each text whole plus an "itinerary_days" event. The final event is
+        ("done", plan) with the same TripPlan plan_trip returns.
+        
+        A section that misses its deadline arrives as fallback content and is listed in
+        plan.degraded; a text section already streaming keeps going while chunks arrive.
+        """
+        country_code = self.country_code(city)
+        climate = self.get_climate_summary(city, month)
+        budget = PlanBudget(self.deadline)
+        result = {"city_description": "", "trip_plan": "", "itinerary_days": None, "climate": climate,
+                  "duration": duration, "month": month, "degraded": []}
+        yield "climate", climate
+        
+        def degrade(section: str):
+            result["degraded"].append(section)
+            METRICS.inc("trip_planner_degraded_sections_total", section=section)
+        
+        def fallback(section: str) -> Any:
+            degrade(section)
+            value = self.fallback_section(section, city, duration, result.get("places"))
+            result[section] = value
+            return value
         
+        def interrupted(section: str) -> Any:
+            # A text section that failed mid-stream: shown text stays, flagged as incomplete
+            if not result[section]:
+                return fallback(section)
+            degrade(section)
+            result[section] += STREAM_INTERRUPTED_TEXT
+            return STREAM_INTERRUPTED_TEXT
+        
+        stored = self.stored_plan(city, duration, month)
+        if stored is not None:
+            # Precomputed plan: send it straight away, then the live weather
+            for section in PLAN_STORE_SECTIONS:
+                result[section] = getattr(stored, section)
+                if result[section] is not None:
+                    yield section, result[section]
+            try:
+                result["weather"] = self._run_within(budget, "weather", self.get_weather_data, city, country_code)
+            except FutureTimeout:
+                fallback("weather")
+            yield "weather", result["weather"]
+            yield "done", TripPlan(**result)
+            return
+        
+        if not self.parallel:
+            for section, fetch in (
+                ("weather", lambda: self.get_weather_data(city, country_code)),
+                ("places", lambda: self.get_places_data(city)),
+                ("flights", lambda: self.get_flight_options(city, month)),
+                ("hotels", lambda: self.get_hotel_options(city)),
+            ):
+                # Catalog-backed stages are local; only the weather call is bounded by its deadline
+                if section != "weather":
+                    result[section] = fetch()
+                elif budget.expired(section):
+                    fallback(section)
+                else:
+                    try:
+                        result[section] = self._run_within(budget, section, fetch)
+                    except FutureTimeout:
+                        fallback(section)
+                yield section, result[section]
+            combined = None
+            if self.combined and not budget.expired("trip_plan"):
+                try:
+                    combined = self._run_within(budget, "trip_plan", self.generate_combined,
+                                                city, duration, result["weather"], result["places"], climate)
+                except FutureTimeout:
+                    pass
+            if combined is not None:
+                result.update(combined)
+                for section in ("city_description", "trip_plan", "itinerary_days"):
+                    yield section, combined[section]
+                yield "done", TripPlan(**result)
+                return
+            for section, chunks in (
+                ("city_description", lambda: self.stream_city_description(city, duration)),
+                ("trip_plan", lambda: self.stream_trip_plan(city, duration, result["weather"], result["places"], climate)),
+            ):
+                if budget.expired(section):
+                    yield section, fallback(section)
+                    continue
+                try:
+                    for chunk in self._stream_within(budget, section, chunks):
+                        result[section] += chunk
+                        yield section, chunk
+                except FutureTimeout:
+                    if result[section]:
+                        degrade(section)  # stalled mid-stream: keep the partial text
+                    else:
+                        yield section, fallback(section)
+                except Exception:
+                    yield section, interrupted(section)
+            yield "done", TripPlan(**result)
+            return
+        
+        # Producers push events onto a queue; this generator drains it on the caller's thread
+        events: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        
+        def produce(section: str, fetch: Callable[[], Any]):
+            value = fetch()
+            events.put((section, value))
+            return value
+        
+        def produce_stream(section: str, chunks: Callable[[], Iterator[str]]):
+            try:
+                for chunk in chunks():
+                    events.put((section, chunk))
+            except Exception:
+                events.put(("_failed", section))
+                return
+            events.put(("_complete", section))
+        
+        def await_data(future, section: str) -> Any:
+            # Late weather or places shouldn't hold the itinerary past their own deadline
+            try:
+                return future.result(timeout=budget.remaining(section))
+            except FutureTimeout:
+                return self.fallback_section(section, city, duration)
+        
+        # Not a context manager: leaving must not wait on stages that blew their deadline
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
         try:
-            weather_context = ""
-            if "current" in weather_data and "error" not in weather_data:
-                temp = weather_data["current"]["main"]["temp"]
-                desc = weather_data["current"]["weather"][0]["description"]
-                weather_context = f"Current weather: {temp}°C, {desc}. "
+            futures = []
             
-            places_list = ", ".join([p["name"] for p in places[:8]])
+            def spawn(fn: Callable, *args):
+                # Tasks spawned by a running producer are registered before that producer finishes,
+                # so the drain loop below can't run out of "_finished" markers early
+                future = submit_in_context(pool, fn, *args)
+                futures.append(future)
+                future.add_done_callback(lambda _: events.put(("_finished", None)))
+                return future
             
-            prompt = f"""Create a detailed {duration}-day trip itinerary for {city}. 
-            {weather_context}
-            Include these attractions: {places_list}
+            def stream_description():
+                spawn(produce_stream, "city_description", lambda: self.stream_city_description(city, duration))
             
-            Format the response as:
-            **Day 1:**
-            - Morning: [activity]
-            - Afternoon: [activity]
-            - Evening: [activity]
+            def stream_itinerary():
+                # The itinerary only waits on weather and places
+                produce_stream("trip_plan", lambda: self.stream_trip_plan(
+                    city, duration, await_data(weather_future, "weather"), await_data(places_future, "places"), climate
+                ))
             
-            Make it practical, well-paced, and engaging. Include timing suggestions and brief descriptions."""
+            def combined_or_fallback():
+                combined = self.generate_combined(
+                    city, duration, await_data(weather_future, "weather"), await_data(places_future, "places"), climate
+                )
+                if combined is None:
+                    stream_description()
+                    stream_itinerary()
+                    return
+                for section in ("city_description", "trip_plan", "itinerary_days"):
+                    events.put((section, combined[section]))
+                events.put(("_complete", "city_description"))
+                events.put(("_complete", "trip_plan"))
             
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return "Unable to generate detailed itinerary at this time."
-    
-    def plan_trip(self, city: str, duration: int, month: str) -> Dict[str, Any]:
-        """Main trip planning function - orchestrates all components"""
-        
-        # Expanded country code mapping for weather API
-        country_codes = {
-            "Tokyo": "JP",
-            "Udaipur": "IN",
-            "Paris": "FR",
-            "London": "GB",
-            "New York": "US",
-            "Dubai": "AE",
-            "Singapore": "SG",
-            "Bangkok": "TH",
-            "Rome": "IT",
-            "Barcelona": "ES",
-            "Istanbul": "TR",
-            "Amsterdam": "NL",
-            "Prague": "CZ",
-            "Vienna": "AT",
-            "Sydney": "AU",
-            "Bali": "ID",
-            "Maldives": "MV",
-            "Jaipur": "IN",
-            "Mumbai": "IN",
-            "Delhi": "IN"
-        }
-        
-        # Try to get country code from mapping, or let OpenWeather auto-detect
-        country_code = country_codes.get(city, "")
+            weather_future = spawn(produce, "weather", lambda: self.get_weather_data(city, country_code))
+            places_future = spawn(produce, "places", lambda: self.get_places_data(city))
+            spawn(produce, "flights", lambda: self.get_flight_options(city, month))
+            spawn(produce, "hotels", lambda: self.get_hotel_options(city))
+            if self.combined:
+                spawn(combined_or_fallback)
+            else:
+                stream_description()
+                spawn(stream_itinerary)
+            
+            pending = {"weather", "places", "flights", "hotels", "city_description", "trip_plan"}
+            last_chunk: Dict[str, float] = {}  # text sections already streaming, and when their last chunk came
+            
+            def next_timeout() -> Optional[float]:
+                if budget.total is None:
+                    return None
+                now = time.monotonic()
+                return min(
+                    max(budget.remaining(section), last_chunk[section] + STREAM_IDLE_TIMEOUT - now)
+                    if section in last_chunk else budget.remaining(section)
+                    for section in pending
+                )
+            
+            finished = 0
+            while pending and finished < len(futures):
+                try:
+                    section, value = events.get(timeout=next_timeout())
+                except queue.Empty:
+                    now = time.monotonic()
+                    for section in sorted(pending):
+                        if not budget.expired(section):
+                            continue
+                        if section not in last_chunk:
+                            pending.discard(section)
+                            yield section, fallback(section)
+                        elif now - last_chunk[section] >= STREAM_IDLE_TIMEOUT:
+                            # Stalled mid-stream: keep the partial text
+                            pending.discard(section)
+                            degrade(section)
+                    continue
+                
+                if section == "_finished":
+                    finished += 1
+                    continue
+                if section == "_complete":
+                    pending.discard(value)
+                    continue
+                if section == "_failed":
+                    if value in pending:
+                        pending.discard(value)
+                        yield value, interrupted(value)
+                    continue
+                if ("trip_plan" if section == "itinerary_days" else section) not in pending:
+                    continue  # arrived after its fallback was sent
+                if section in ("city_description", "trip_plan"):
+                    last_chunk[section] = time.monotonic()
+                    result[section] += value
+                else:
+                    pending.discard(section)
+                    result[section] = value
+                yield section, value
+            
+            for future in futures:
+                if future.done():
+                    future.result()  # surface producer errors
+        finally:
+            pool.shutdown(wait=False)
         
-        # Gather all data
-        weather_data = self.get_weather_data(city, country_code)
-        places = self.get_places_data(city)
-        flights = self.get_flight_options(city, month)
-        hotels = self.get_hotel_options(city)
+        yield "done", TripPlan(**result)
+
+
+# Headless planning service
+SERVICE_MAX_CONCURRENCY = int(os.environ.get("TRIP_PLANNER_SERVICE_CONCURRENCY", "8"))
+SERVICE_TIMEOUT = (3.05, 120)  # LLM generation dominates the read timeout
+# plan_trip waits for whole Gemini responses, so the service needs far more than the UI's PLAN_DEADLINE;
+# it stays under SERVICE_TIMEOUT's read timeout so callers get the fallback plan rather than a timeout
+SERVICE_PLAN_DEADLINE = float(os.environ.get("TRIP_PLANNER_SERVICE_PLAN_DEADLINE", "90"))
+
+
+def parse_plan_request(payload: Any) -> Tuple[str, int, str]:
+    """Validate a {"city", "duration", "month"} request body, raising ValueError on bad input"""
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    city = payload.get("city")
+    duration = payload.get("duration")
+    month = payload.get("month")
+    if not isinstance(city, str) or not city.strip():
+        raise ValueError("'city' must be a non-empty string")
+    if not isinstance(duration, int) or isinstance(duration, bool) or not 1 <= duration <= 14:
+        raise ValueError("'duration' must be an integer between 1 and 14")
+    if month not in MONTHS:
+        raise ValueError("'month' must be a full month name, e.g. 'May'")
+    return city.strip(), duration, month
+
+
+def create_service_app(agent: TripPlannerAgent, max_concurrency: int = SERVICE_MAX_CONCURRENCY):
+    """aiohttp application exposing POST /plan backed by one long-lived agent"""
+    from aiohttp import web
+    
+    # Each plan occupies one worker thread for its blocking upstream calls; the
+    # semaphore bounds in-flight plans so extra requests queue instead of piling up
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="plan")
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def plan(request):
+        try:
+            city, duration, month = parse_plan_request(await request.json())
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
         
-        # Generate LLM-powered content
-        city_description = self.generate_city_description(city, duration)
-        trip_plan = self.generate_trip_plan(city, duration, weather_data, places)
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(executor, plan_with_trace, city, duration, month)
+        return web.json_response(result.to_dict())
+    
+    def plan_with_trace(city: str, duration: int, month: str) -> TripPlan:
+        with start_trace("plan_trip") as trace:
+            result = agent.plan_trip(city, duration, month)
+        log_event("plan", trace_id=trace.trace_id, city=city, duration=duration, month=month,
+                  spans=trace.waterfall())
+        return result
+    
+    async def health(request):
+        return web.json_response({"status": "ok"})
+    
+    async def metrics(request):
+        return web.Response(text=METRICS.render_prometheus(), content_type="text/plain",
+                            headers={"X-Content-Type-Options": "nosniff"})
+    
+    async def shutdown(app):
+        executor.shutdown(wait=False)
+    
+    app = web.Application()
+    app.add_routes([web.post("/plan", plan), web.get("/healthz", health), web.get("/metrics", metrics)])
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+def run_service(host: str, port: int, max_concurrency: int = SERVICE_MAX_CONCURRENCY,
+                deadline: float = SERVICE_PLAN_DEADLINE):
+    """Serve plan_trip over HTTP until interrupted, answering with fallback sections after deadline seconds"""
+    from aiohttp import web
+    
+    gemini_key = read_secret("GEMINI_API_KEY")
+    weather_key = read_secret("OPENWEATHER_API_KEY")
+    # Each in-flight plan holds up to three OpenWeather connections
+    configure_http_client(pool_size=max(HTTP_POOL_SIZE, max_concurrency * 3))
+    
+    agent = TripPlannerAgent(gemini_key, weather_key, deadline=deadline)
+    log_event("startup", import_ms=round(IMPORT_MS, 1),
+              ready_ms=round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1))
+    web.run_app(create_service_app(agent, max_concurrency), host=host, port=port)
+
+
+def plan_trip_remote(service_url: str, city: str, duration: int, month: str) -> TripPlan:
+    """Call a planning service's POST /plan and return its TripPlan"""
+    response = get_http_client().post(
+        f"{service_url.rstrip('/')}/plan",
+        json={"city": city, "duration": duration, "month": month},
+        # A timed-out or failed plan isn't retried: each attempt may wait out the full read timeout
+        # and runs the whole plan again on the service
+        timeout=SERVICE_TIMEOUT, max_retries=0
+    )
+    response.raise_for_status()
+    return TripPlan.from_dict(response.json())
+
+
+# Batch planning
+BATCH_CONCURRENCY = 4
+
+
+def read_batch_records(stream) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, parsed JSON or the ValueError raised parsing it) for non-blank lines"""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+
+def completed_batch_lines(output_path: str) -> set:
+    """Line numbers already planned successfully by an earlier run writing to output_path"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a partial line left by an interrupted run
+            if record.get("ok"):
+                done.add(record["line"])
+    return done
+
+
+def run_batch(agent: TripPlannerAgent, records: List[Tuple[int, Any]], output, concurrency: int = BATCH_CONCURRENCY,
+              skip_lines: Optional[set] = None) -> Dict[str, Any]:
+    """Plan every record, writing one JSON line per record to output as it finishes"""
+    skip_lines = skip_lines or set()
+    started = time.perf_counter()
+    latencies = []
+    summary = {"planned": 0, "failed": 0, "skipped": 0}
+    
+    def emit(record: Dict):
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+    
+    jobs = []
+    for line_number, payload in records:
+        if line_number in skip_lines:
+            summary["skipped"] += 1
+            continue
+        try:
+            if isinstance(payload, Exception):
+                raise ValueError(f"Invalid JSON: {payload}")
+            jobs.append((line_number, parse_plan_request(payload)))
+        except ValueError as e:
+            summary["failed"] += 1
+            emit({"line": line_number, "ok": False, "error": str(e)})
+    
+    def plan(city: str, duration: int, month: str) -> Tuple[TripPlan, float]:
+        plan_started = time.perf_counter()
+        result = agent.plan_trip(city, duration, month)
+        return result, time.perf_counter() - plan_started
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Warm the shared caches once per city (geocoding, weather) and per (city, duration)
+        # (description) so records for the same destination don't repeat that work
+        cities = {city for _, (city, _, _) in jobs}
+        descriptions = {(city, duration) for _, (city, duration, _) in jobs}
+        warmups = [pool.submit(agent.get_weather_data, city, agent.country_code(city)) for city in cities]
+        warmups += [pool.submit(agent.generate_city_description, city, duration) for city, duration in descriptions]
+        for future in as_completed(warmups):
+            future.result()
         
-        return {
-            "city_description": city_description,
-            "weather": weather_data,
-            "places": places,
-            "flights": flights,
-            "hotels": hotels,
-            "trip_plan": trip_plan,
-            "duration": duration,
-            "month": month
+        futures = {pool.submit(plan, *request): (line_number, request) for line_number, request in jobs}
+        for future in as_completed(futures):
+            line_number, (city, duration, month) = futures[future]
+            record = {"line": line_number, "input": {"city": city, "duration": duration, "month": month}}
+            try:
+                result, elapsed = future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                emit({**record, "ok": False, "error": str(e)})
+                continue
+            summary["planned"] += 1
+            latencies.append(elapsed)
+            emit({**record, "ok": True, "elapsed_s": round(elapsed, 3), "result": result.to_dict()})
+    
+    wall = time.perf_counter() - started
+    latencies.sort()
+    summary.update({
+        "wall_s": round(wall, 3),
+        "plans_per_s": round(summary["planned"] / wall, 2) if wall else 0.0,
+        "p50_s": round(latencies[len(latencies) // 2], 3) if latencies else None,
+        "p95_s": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+    })
+    return summary
+
+
+def run_batch_cli(input_path: str, output_path: Optional[str], concurrency: int, resume: bool):
+    gemini_key = read_secret("GEMINI_API_KEY")
+    weather_key = read_secret("OPENWEATHER_API_KEY")
+    # Offline runs want complete plans, so no latency budget
+    agent = TripPlannerAgent(gemini_key, weather_key, deadline=0)
+    
+    skip_lines = completed_batch_lines(output_path) if resume and output_path else set()
+    source = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    output = sys.stdout if not output_path else open(output_path, "a" if resume else "w", encoding="utf-8")
+    try:
+        records = list(read_batch_records(source))
+        summary = run_batch(agent, records, output, concurrency, skip_lines)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(summary), file=sys.stderr)
+
+
+# Plan warehouse precompute
+TRIP_DURATIONS = [2, 3, 4, 5, 6, 7]
+
+
+def build_stored_plan(agent: TripPlannerAgent, city: str, duration: int, month: str) -> Optional[TripPlan]:
+    """Warehouse sections for one grid cell, or None if Gemini fell back.
+    
+    The itinerary is planned against typical weather for the month rather than today's conditions.
+    """
+    climate = agent.get_climate_summary(city, month)
+    places = agent.get_places_data(city)
+    combined = agent.generate_combined(city, duration, None, places, climate) if agent.combined else None
+    if combined is None:
+        combined = {
+            "city_description": agent.generate_city_description(city, duration),
+            "trip_plan": agent.generate_trip_plan(city, duration, None, places, climate),
+            "itinerary_days": None,
         }
+        if (combined["trip_plan"] == TRIP_PLAN_ERROR_TEXT
+                or combined["city_description"] == agent._city_description_error_text(city)):
+            return None
+    return TripPlan(**combined, places=places, flights=agent.get_flight_options(city, month),
+                    hotels=agent.get_hotel_options(city), duration=duration, month=month)
+
+
+def precompute_plans(agent: TripPlannerAgent, warehouse: PlanWarehouse, cities: Optional[List[str]] = None,
+                     durations: List[int] = TRIP_DURATIONS, months: List[str] = MONTHS, refresh_all: bool = False,
+                     concurrency: int = BATCH_CONCURRENCY) -> Dict[str, Any]:
+    """Fill the warehouse for the catalog grid, rebuilding only missing or stale entries unless refresh_all"""
+    cities = cities or [destination.name for destination in agent.catalog.destinations]
+    # City-major order keeps the months of one (city, duration) together, so its description is cached
+    grid = [(city, duration, month) for city in cities for duration in durations for month in months]
+    todo = grid if refresh_all else warehouse.stale(grid, agent.model_name)
+    
+    started = time.perf_counter()
+    built = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(build_stored_plan, agent, *key): key for key in todo}
+        for future in as_completed(futures):
+            try:
+                plan = future.result()
+            except Exception:
+                plan = None
+            if plan is None:
+                failed += 1
+                continue
+            warehouse.put(*futures[future], plan, agent.model_name)
+            built += 1
+    return {
+        "grid": len(grid),
+        "fresh": len(grid) - len(todo),
+        "built": built,
+        "failed": failed,
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "store": warehouse.stats(),
+    }
+
+
+def precompute_cli(cities: Optional[List[str]], durations: Optional[List[int]], refresh_all: bool,
+                   concurrency: int, max_age_days: Optional[float], stats_only: bool):
+    warehouse = get_plan_warehouse()
+    if max_age_days is not None:
+        warehouse.max_age = max_age_days * 24 * 3600
+    if stats_only:
+        print(json.dumps(warehouse.stats(), indent=2))
+        return
+    gemini_key = read_secret("GEMINI_API_KEY")
+    if not gemini_key:
+        # Fallback text is generated on the fly anyway; storing it would only hide real plans
+        sys.exit("GEMINI_API_KEY is required to precompute plans")
+    agent = TripPlannerAgent(gemini_key, read_secret("OPENWEATHER_API_KEY"), deadline=0, plan_warehouse=warehouse)
+    report = precompute_plans(agent, warehouse, cities, durations or TRIP_DURATIONS,
+                              refresh_all=refresh_all, concurrency=concurrency)
+    print(json.dumps(report, indent=2))
 
 
 # Streamlit UI
+def render_weather(weather: Optional[WeatherSummary]):
+    """Render current conditions and the 5-day forecast"""
+    if weather is not None and weather.available:
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("Temperature", f"{weather.temp}°C")
+        with col2:
+            st.metric("Feels Like", f"{weather.feels_like}°C")
+        with col3:
+            st.metric("Humidity", f"{weather.humidity}%")
+        with col4:
+            st.metric("Condition", weather.condition)
+        
+        st.info(f"**Current Weather:** {weather.description.title()}")
+        
+        # Forecast
+        if weather.daily:
+            st.subheader("5-Day Forecast")
+            forecast_cols = st.columns(5)
+            for day_data, col in zip(weather.daily, forecast_cols):
+                date = datetime.strptime(day_data.date, '%Y-%m-%d').strftime('%b %d')
+                
+                with col:
+                    st.markdown(f"**{date}**")
+                    st.markdown(f"{day_data.temp_min:.0f}–{day_data.temp_max:.0f}°C")
+                    st.markdown(f"{day_data.condition}")
+                    if day_data.precipitation_mm:
+                        st.caption(f"💧 {day_data.precipitation_mm} mm")
+    else:
+        st.warning("Weather data unavailable. Please check API key.")
+
+
+def render_climate(climate: Optional[Dict]):
+    """Render typical conditions for the travel month"""
+    if climate:
+        st.info(
+            f"**Typical {climate['month']}:** {climate['summary']} — highs around {climate['avg_high_c']:.0f}°C, "
+            f"lows around {climate['avg_low_c']:.0f}°C, about {climate['precipitation_mm']} mm of rain."
+        )
+    else:
+        st.caption("Typical travel-month climate isn't available for this destination.")
+
+
+def render_travel_dates(duration: int, start_date: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """Render departure/return dates and return them"""
+    st.header("📅 Travel Dates")
+    if start_date is None:
+        start_date = datetime.now() + timedelta(days=30)  # Example: 30 days from now
+    end_date = start_date + timedelta(days=duration - 1)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.info(f"**Departure:** {start_date.strftime('%B %d, %Y')}")
+    with col2:
+        st.info(f"**Return:** {end_date.strftime('%B %d, %Y')}")
+    with col3:
+        st.info(f"**Duration:** {duration} days")
+    return start_date, end_date
+
+
+def render_flights(flights: List[Flight]):
+    if not flights:
+        st.caption("No flight offers for this destination yet.")
+    for idx, flight in enumerate(flights, 1):
+        with st.expander(f"Option {idx}: {flight.airline} - {flight.price_label}", expanded=(idx==1)):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.write(f"**Route:** {flight.departure} → {flight.arrival}")
+            with col2:
+                st.write(f"**Duration:** {flight.duration_label}")
+            with col3:
+                st.write(f"**Stops:** {flight.stops_label}")
+
+
+def render_hotels(hotels: List[Hotel]):
+    if not hotels:
+        st.caption("No hotel offers for this destination yet.")
+    for idx, hotel in enumerate(hotels, 1):
+        with st.expander(f"{hotel.name} - {'⭐' * int(hotel.rating)} ({hotel.rating})"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write(f"**Price:** {hotel.price_label} per night")
+            with col2:
+                st.write(f"**Amenities:** {', '.join(hotel.amenities)}")
+
+
+def render_places(places: List[Place]):
+    places_cols = st.columns(3)
+    for idx, place in enumerate(places[:6]):
+        with places_cols[idx % 3]:
+            st.markdown(f"""
+            **{place.name}**  
+            Type: {place.type.title()}  
+            Rating: {'⭐' * int(place.rating)} ({place.rating})
+            """)
+
+
+def render_waterfall(trace: Trace):
+    """Debug panel: when each stage started and how long it took"""
+    import altair as alt
+    
+    with st.expander("⏱️ Timing waterfall", expanded=True):
+        spans = trace.waterfall()
+        if not spans:
+            st.caption("No spans were recorded for this request.")
+            return
+        rows = [
+            {**span, "end_ms": span["start_ms"] + span["duration_ms"], "label": f"{idx:02d} {span['span']}"}
+            for idx, span in enumerate(spans)
+        ]
+        chart = alt.Chart(alt.Data(values=rows)).mark_bar().encode(
+            x=alt.X("start_ms:Q", title="ms since request start"),
+            x2="end_ms:Q",
+            y=alt.Y("label:N", sort=None, title=None),
+            color=alt.Color("error:N", legend=None),
+            tooltip=["span:N", "start_ms:Q", "duration_ms:Q", "error:N"],
+        )
+        st.altair_chart(chart, use_container_width=True)
+        st.dataframe(rows, column_order=["span", "start_ms", "duration_ms", "error"], use_container_width=True)
+
+
+def build_trip_summary(result: TripPlan, city: str, start_date: datetime, end_date: datetime) -> str:
+    """Plain-text export of a finished plan"""
+    return f"""
+TRIP PLAN: {result.duration}-day trip to {city} in {result.month}
+
+{result.city_description}
+
+TRAVEL DATES:
+Departure: {start_date.strftime('%B %d, %Y')}
+Return: {end_date.strftime('%B %d, %Y')}
+
+ITINERARY:
+{result.trip_plan}
+
+FLIGHTS:
+{chr(10).join([f"- {f.airline}: {f.price_label} ({f.duration_label})" for f in result.flights])}
+
+HOTELS:
+{chr(10).join([f"- {h.name}: {h.price_label}/night" for h in result.hotels])}
+"""
+
+
+def cache_resource(**options):
+    """st.cache_resource applied on first call, so defining cached functions doesn't import Streamlit"""
+    def decorate(fn: Callable) -> Callable:
+        cached = None
+        
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            nonlocal cached
+            if cached is None:
+                cached = st.cache_resource(**options)(fn)
+            return cached(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@cache_resource()
+def get_runtime() -> Dict[str, Any]:
+    """Clients, caches and limiters built once per process.
+    
+    Streamlit re-executes this script on every rerun, which resets module globals; caching them
+    here keeps every session's agent on the same connection pool, caches and quotas.
+    """
+    started = time.perf_counter()
+    runtime = {
+        "http_client": get_http_client(),
+        "geo_cache": get_geo_cache(),
+        "weather_cache": get_weather_cache(),
+        "llm_cache": get_llm_cache(),
+        "catalog": get_catalog(),
+        "climatology": get_climatology(),
+        "single_flight": get_single_flight(),
+        "gemini_limiter": get_gemini_limiter(),
+        "plan_warehouse": get_plan_warehouse(),
+        "inventory": get_inventory(),
+    }
+    log_event("startup", import_ms=round(IMPORT_MS, 1), init_ms=round((time.perf_counter() - started) * 1000, 1))
+    return runtime
+
+
+@cache_resource(max_entries=8)
+def get_agent(gemini_key: str, weather_key: str, parallel: bool, combined: bool) -> TripPlannerAgent:
+    """One long-lived agent per configuration, shared across reruns and sessions"""
+    return TripPlannerAgent(gemini_key, weather_key, parallel=parallel, combined=combined, **get_runtime())
+
+
+# Finished plans kept across Streamlit reruns
+SESSION_MAX_PLANS = 5
+SESSION_MAX_BYTES = 512 * 1024
+MAX_SESSIONS = int(os.environ.get("TRIP_PLANNER_MAX_SESSIONS", "500"))
+SESSION_IDLE_TTL = 3600  # seconds before an idle session's plans are dropped
+
+
+class SessionPlanStore:
+    """Finished plans per browser session keyed by (city, duration, month).
+    
+    Plans are held packed, and each session keeps its most recent ones within a count and byte
+    budget; the least recently active sessions are dropped once there are too many or they go idle.
+    """
+    
+    def __init__(self, max_sessions: int = MAX_SESSIONS, max_plans: int = SESSION_MAX_PLANS,
+                 max_bytes: int = SESSION_MAX_BYTES, idle_ttl: float = SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.max_plans = max_plans
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        # session id -> [last active, plans (key -> (entry, size)), total size]
+        self._sessions: "OrderedDict[str, List]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, session_id: str, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or key not in session[1]:
+                return None
+            session[0] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            session[1].move_to_end(key)
+            entry = session[1][key][0]
+        return {**entry, "result": TripPlan.unpack(entry["result"])}
+    
+    def put(self, session_id: str, key: Tuple, entry: Dict[str, Any]):
+        entry = {**entry, "result": entry["result"].pack()}
+        size = len(entry["result"])
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or [now, OrderedDict(), 0]
+            plans = session[1]
+            if key in plans:
+                session[2] -= plans.pop(key)[1]
+            plans[key] = (entry, size)
+            session[0] = now
+            session[2] += size
+            # The newest plan always stays, even if it alone exceeds the byte budget
+            while len(plans) > 1 and (len(plans) > self.max_plans or session[2] > self.max_bytes):
+                session[2] -= plans.popitem(last=False)[1][1]
+            self._sessions[session_id] = session
+            
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if len(self._sessions) <= self.max_sessions and now - oldest[0] < self.idle_ttl:
+                    break
+                del self._sessions[oldest_id]
+            self._publish()
+    
+    def _publish(self):
+        METRICS.set_gauge("trip_planner_session_store_sessions", len(self._sessions))
+        METRICS.set_gauge("trip_planner_session_store_plans", sum(len(s[1]) for s in self._sessions.values()))
+        METRICS.set_gauge("trip_planner_session_store_bytes", sum(s[2] for s in self._sessions.values()))
+
+
+@cache_resource()
+def get_plan_store() -> SessionPlanStore:
+    return SessionPlanStore()
+
+
+def result_events(result: TripPlan) -> List[Tuple[str, Any]]:
+    """A finished plan replayed as plan_trip_stream events"""
+    events = [(section, getattr(result, section)) for section in
+              ("weather", "climate", "places", "flights", "hotels", "city_description", "trip_plan")]
+    events.append(("done", result))
+    return events
+
+
 def main():
+    st.set_page_config(
+        page_title="AI Trip Planner Agent",
+        page_icon="✈️",
+        layout="wide"
+    )
     st.title("✈️ AI Trip Planner Agent")
     st.markdown("**Powered by Gemini LLM + Real-time Data APIs**")
     
@@ -332,18 +3479,36 @@ def main():
         
         gemini_key = st.text_input(
             "Gemini API Key",
-            value=GEMINI_API_KEY,
+            value=read_secret("GEMINI_API_KEY"),
             type="password",
             help="Get your key from https://makersuite.google.com/app/apikey"
         )
         
         weather_key = st.text_input(
             "OpenWeather API Key",
-            value=OPENWEATHER_API_KEY,
+            value=read_secret("OPENWEATHER_API_KEY"),
             type="password",
             help="Get your key from https://openweathermap.org/api"
         )
         
+        parallel = st.checkbox(
+            "Parallel data fetching",
+            value=True,
+            help="Fetch weather, places and LLM content concurrently. Disable to run each stage sequentially."
+        )
+        
+        combined = st.checkbox(
+            "Single Gemini call",
+            value=False,
+            help="Generate the city description and itinerary in one structured request. Falls back to two calls if the response can't be parsed."
+        )
+        
+        show_timings = st.checkbox(
+            "Show timing waterfall",
+            value=False,
+            help="Debug panel with per-stage latency for the current request."
+        )
+        
         st.markdown("---")
         st.markdown("### About")
         st.info("This agent uses MCP architecture to combine LLM reasoning with real-time data APIs for intelligent trip planning.")
@@ -378,13 +3543,18 @@ def main():
             )
             if not city:
                 st.warning("⚠️ Please enter a city name to continue")
+            else:
+                suggestion = get_runtime()["catalog"].suggest(city)
+                # A close spelling may still be a different place, so it is only used once confirmed
+                if suggestion and st.checkbox(f"Did you mean {suggestion}?", key=f"suggest:{city}"):
+                    city = suggestion
         else:
             city = city_selection
     
     with col2:
         duration = st.selectbox(
             "Trip Duration",
-            [2, 3, 4, 5, 6, 7],
+            TRIP_DURATIONS,
             index=1,
             help="Number of days"
         )
@@ -413,7 +3583,13 @@ def main():
     
     st.markdown("---")
     
+    # Deployment setting only: a widget would let any visitor point this server at their own URL
+    service_url = read_secret("TRIP_PLANNER_SERVICE_URL")
+    
     # Plan trip button
+    store = get_plan_store()
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    plan_key = (city, duration, month)
     if st.button("🚀 Generate Trip Plan", type="primary", use_container_width=True):
         # Validate city input
         if city_selection == "Custom (Enter your own)" and not city:
@@ -427,139 +3603,139 @@ def main():
         if not gemini_key or not weather_key:
             st.error("⚠️ Please provide API keys in the sidebar to continue.")
             st.info("**Note:** Demo mode available with fallback data if APIs are not configured.")
-        
-        # Initialize agent
-        agent = TripPlannerAgent(gemini_key, weather_key)
-        
-        with st.spinner(f"🤖 AI Agent is planning your {duration}-day trip to {city}..."):
-            # Get trip plan
-            result = agent.plan_trip(city, duration, month)
-            
-            # Display results
-            st.success(f"✅ Trip plan generated for {city}!")
-            
-            # 1. City Description
-            st.header(f"🏙️ About {city}")
-            st.write(result["city_description"])
-            
-            # 2. Weather Information
-            st.header("🌤️ Weather Information")
-            weather = result["weather"]
-            
-            if "error" not in weather and "current" in weather:
-                col1, col2, col3, col4 = st.columns(4)
-                
-                current = weather["current"]
-                with col1:
-                    st.metric("Temperature", f"{current['main']['temp']}°C")
-                with col2:
-                    st.metric("Feels Like", f"{current['main']['feels_like']}°C")
-                with col3:
-                    st.metric("Humidity", f"{current['main']['humidity']}%")
-                with col4:
-                    st.metric("Condition", current['weather'][0]['main'])
-                
-                st.info(f"**Current Weather:** {current['weather'][0]['description'].title()}")
-                
-                # Forecast
-                if "forecast" in weather:
-                    st.subheader("5-Day Forecast")
-                    forecast_data = weather["forecast"]["list"]
-                    
-                    forecast_cols = st.columns(5)
-                    for i, col in enumerate(forecast_cols):
-                        if i * 8 < len(forecast_data):
-                            day_data = forecast_data[i * 8]
-                            date = datetime.fromtimestamp(day_data['dt']).strftime('%b %d')
-                            temp = day_data['main']['temp']
-                            desc = day_data['weather'][0]['main']
-                            
-                            with col:
-                                st.markdown(f"**{date}**")
-                                st.markdown(f"{temp}°C")
-                                st.markdown(f"{desc}")
+        stored = None
+    else:
+        # Reruns from other widgets redraw this session's finished plan without upstream calls
+        stored = store.get(session_id, plan_key) if city else None
+        if stored is None:
+            return
+    
+    # Lay out every section up front; each placeholder fills in as its data arrives
+    st.header(f"🏙️ About {city}")
+    description_slot = st.empty()
+    
+    st.header("🌤️ Weather Information")
+    weather_slot = st.empty()
+    climate_slot = st.empty()
+    
+    start_date, end_date = render_travel_dates(duration, stored["start_date"] if stored else None)
+    
+    st.header("✈️ Flight Options")
+    flights_slot = st.empty()
+    
+    st.header("🏨 Hotel Recommendations")
+    hotels_slot = st.empty()
+    
+    st.header("🗺️ Day-by-Day Itinerary")
+    plan_slot = st.empty()
+    
+    st.header("🎯 Top Attractions")
+    places_slot = st.empty()
+    
+    renderers = {
+        "weather": (weather_slot, render_weather),
+        "climate": (climate_slot, render_climate),
+        "flights": (flights_slot, render_flights),
+        "hotels": (hotels_slot, render_hotels),
+        "places": (places_slot, render_places),
+    }
+    text_slots = {"city_description": description_slot, "trip_plan": plan_slot}
+    texts = {"city_description": "", "trip_plan": ""}
+    
+    def render_events(events: Iterable[Tuple[str, Any]]) -> TripPlan:
+        for section, value in events:
+            if section in text_slots:
+                texts[section] += value
+                text_slots[section].markdown(texts[section])
+            elif section in renderers:
+                slot, render = renderers[section]
+                with slot.container(), span(f"render {section}"):
+                    render(value)
+            elif section == "done":
+                result = value
+        return result
+    
+    if stored is not None:
+        result = render_events(result_events(stored["result"]))
+        trace = stored["trace"]
+    else:
+        with st.spinner(f"🤖 AI Agent is planning your {duration}-day trip to {city}..."), \
+                start_trace("plan_trip") as trace, span("request"):
+            if service_url:
+                try:
+                    remote = plan_trip_remote(service_url, city, duration, month)
+                except requests.RequestException as e:
+                    st.error(f"⚠️ Planning service error: {e}")
+                    st.stop()
+                events = result_events(remote)
             else:
-                st.warning("Weather data unavailable. Please check API key.")
-            
-            # 3. Travel Dates
-            st.header("📅 Travel Dates")
-            start_date = datetime.now() + timedelta(days=30)  # Example: 30 days from now
-            end_date = start_date + timedelta(days=duration - 1)
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.info(f"**Departure:** {start_date.strftime('%B %d, %Y')}")
-            with col2:
-                st.info(f"**Return:** {end_date.strftime('%B %d, %Y')}")
-            with col3:
-                st.info(f"**Duration:** {duration} days")
-            
-            # 4. Flight Options
-            st.header("✈️ Flight Options")
-            for idx, flight in enumerate(result["flights"], 1):
-                with st.expander(f"Option {idx}: {flight['airline']} - {flight['price']}", expanded=(idx==1)):
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.write(f"**Route:** {flight['departure']} → {flight['arrival']}")
-                    with col2:
-                        st.write(f"**Duration:** {flight['duration']}")
-                    with col3:
-                        st.write(f"**Stops:** {flight['stops']}")
-            
-            # 5. Hotel Options
-            st.header("🏨 Hotel Recommendations")
-            for idx, hotel in enumerate(result["hotels"], 1):
-                with st.expander(f"{hotel['name']} - {'⭐' * int(hotel['rating'])} ({hotel['rating']})"):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write(f"**Price:** {hotel['price_per_night']} per night")
-                    with col2:
-                        st.write(f"**Amenities:** {', '.join(hotel['amenities'])}")
-            
-            # 6. Trip Itinerary
-            st.header("🗺️ Day-by-Day Itinerary")
-            st.markdown(result["trip_plan"])
-            
-            # 7. Top Attractions
-            st.header("🎯 Top Attractions")
-            places_cols = st.columns(3)
-            for idx, place in enumerate(result["places"][:6]):
-                with places_cols[idx % 3]:
-                    st.markdown(f"""
-                    **{place['name']}**  
-                    Type: {place['type'].title()}  
-                    Rating: {'⭐' * int(place['rating'])} ({place['rating']})
-                    """)
-            
-            # Download button
-            st.markdown("---")
-            trip_summary = f"""
-TRIP PLAN: {duration}-day trip to {city} in {month}
-
-{result['city_description']}
-
-TRAVEL DATES:
-Departure: {start_date.strftime('%B %d, %Y')}
-Return: {end_date.strftime('%B %d, %Y')}
+                agent = get_agent(gemini_key, weather_key, parallel, combined)
+                events = agent.plan_trip_stream(city, duration, month)
+            result = render_events(events)
+        store.put(session_id, plan_key, {"result": result, "start_date": start_date, "trace": trace})
+    
+    st.success(f"✅ Trip plan generated for {city}!")
+    if result.degraded:
+        st.info(f"⏱️ Showing quick fallback content for: {', '.join(s.replace('_', ' ') for s in result.degraded)}. "
+                "Generate again in a moment for the full version.")
+    
+    # Download button; the text is only built when clicked, and clicking doesn't rerun the page
+    st.markdown("---")
+    st.download_button(
+        label="📥 Download Trip Plan",
+        data=lambda: build_trip_summary(result, city, start_date, end_date),
+        file_name=f"trip_plan_{city}_{duration}days.txt",
+        mime="text/plain",
+        on_click="ignore"
+    )
+    
+    if show_timings:
+        render_waterfall(trace)
 
-ITINERARY:
-{result['trip_plan']}
 
-FLIGHTS:
-{chr(10).join([f"- {f['airline']}: {f['price']} ({f['duration']})" for f in result['flights']])}
+def cli(argv: List[str]):
+    """Command-line entry points; `streamlit run ps-1a.py` still runs the UI"""
+    parser = argparse.ArgumentParser(prog="ps-1a.py", description="AI Trip Planner Agent")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    serve = commands.add_parser("serve", help="Run the headless planning service")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--max-concurrency", type=int, default=SERVICE_MAX_CONCURRENCY,
+                       help="Plans processed in parallel by this worker")
+    serve.add_argument("--deadline", type=float, default=SERVICE_PLAN_DEADLINE,
+                       help="Seconds before a plan's unfinished sections fall back (0 disables)")
+    
+    batch = commands.add_parser("batch", help="Plan trips for JSONL records of {city, duration, month}")
+    batch.add_argument("input", nargs="?", default="-", help="JSONL input file, or - for stdin")
+    batch.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    batch.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    batch.add_argument("--resume", action="store_true",
+                       help="Append to --output, skipping lines it already records as planned")
+    
+    precompute = commands.add_parser("precompute", help="Fill the plan warehouse for the catalog grid")
+    precompute.add_argument("--cities", nargs="+", help="Catalog city names (default: every destination)")
+    precompute.add_argument("--durations", nargs="+", type=int, help="Trip lengths in days (default: 2-7)")
+    precompute.add_argument("--all", action="store_true", help="Rebuild every entry, not just missing or stale ones")
+    precompute.add_argument("--max-age-days", type=float, help="Entries older than this count as stale")
+    precompute.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    precompute.add_argument("--stats", action="store_true", help="Only print warehouse size and hit rate")
+    
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        run_service(args.host, args.port, args.max_concurrency, args.deadline)
+    elif args.command == "batch":
+        run_batch_cli(args.input, args.output, args.concurrency, args.resume)
+    elif args.command == "precompute":
+        precompute_cli(args.cities, args.durations, args.all, args.concurrency, args.max_age_days, args.stats)
 
-HOTELS:
-{chr(10).join([f"- {h['name']}: {h['price_per_night']}/night" for h in result['hotels']])}
-"""
-            st.download_button(
-                label="📥 Download Trip Plan",
-                data=trip_summary,
-                file_name=f"trip_plan_{city}_{duration}days.txt",
-                mime="text/plain"
-            )
 
+IMPORT_MS = (time.perf_counter() - _IMPORT_STARTED) * 1000
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        cli(sys.argv[1:])
+    else:
+        main()
 
 #push this into GitHub with commit message "Add AI Trip Planner Agent with enhanced features and expanded city support"
\ No newline at end of file
@@ -0,0 +1,33 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench
+
+
+@pytest.fixture(scope="session")
+def app():
+    """The planner module; ps-1a.py isn't importable by name, so bench loads it as trip_planner"""
+    return bench.load_app()
+
+
+@pytest.fixture(scope="session")
+def stubs():
+    """The benchmark module, for its local OpenWeather and Gemini stand-ins"""
+    return bench
+
+
+@pytest.fixture
+def wait_until():
+    """Poll a condition until it holds, failing the test if it never does"""
+    def wait(condition, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                pytest.fail("condition not reached in time")
+            time.sleep(0.005)
+    return wait
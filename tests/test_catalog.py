@@ -0,0 +1,41 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def catalog(app):
+    return app.DestinationCatalog.load()
+
+
+@pytest.mark.parametrize("query, name", [
+    ("Delhi", "Delhi"),
+    ("  dElHi. ", "Delhi"),
+    ("NYC", "New York"),
+    ("new york city", "New York"),
+    ("Roma", "Rome"),
+    ("Rome, IT", "Rome"),
+    ("Paris City", "Paris"),
+])
+def test_lookup_matches_names_aliases_and_country_codes(catalog, query, name):
+    found = catalog.lookup(query)
+    assert (found.name if found else None) == name
+
+
+@pytest.mark.parametrize("query, suggestion", [("Delphi", "Delhi"), ("Rom", "Rome"), ("Pariss", "Paris")])
+def test_look_alike_names_are_only_suggested(catalog, query, suggestion):
+    # Delphi is in Greece: returning Delhi's data for it would plan the wrong trip
+    assert catalog.lookup(query) is None
+    assert catalog.suggest(query) == suggestion
+
+
+def test_no_suggestion_for_exact_or_unrelated_names(catalog):
+    assert catalog.suggest("Delhi") is None
+    assert catalog.suggest("Kyoto") is None
+    assert catalog.suggest("") is None
+
+
+def test_agent_treats_look_alike_as_custom_city(app):
+    agent = app.TripPlannerAgent("", "test", deadline=0, plan_warehouse=app.PlanWarehouse(":memory:"))
+    assert agent.country_code("Delphi") == ""
+    assert agent.get_climate_summary("Delphi", "May") is None
+    assert agent.stored_plan("Delphi", 3, "May") is None
+    assert all("Delphi" in hotel.name for hotel in agent.get_hotel_options("Delphi"))
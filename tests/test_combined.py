@@ -0,0 +1,40 @@
+import json
+
+
+def combined_reply(count: int, **overrides) -> str:
+    return json.dumps({
+        "city_description": "  A city of canals.  ",
+        "days": [{"day": day, "morning": "Museum ", "afternoon": "Walk", "evening": "Dinner"}
+                 for day in range(1, count + 1)],
+        **overrides,
+    })
+
+
+def test_parses_well_formed_reply_and_trims_text(app):
+    parsed = app.TripPlannerAgent._parse_combined(combined_reply(2), 2)
+    assert parsed == {
+        "city_description": "A city of canals.",
+        "days": [{"day": 1, "morning": "Museum", "afternoon": "Walk", "evening": "Dinner"},
+                 {"day": 2, "morning": "Museum", "afternoon": "Walk", "evening": "Dinner"}],
+    }
+
+
+def test_accepts_reply_wrapped_in_code_fence(app):
+    fenced = "```json\n" + combined_reply(1) + "\n```"
+    assert app.TripPlannerAgent._parse_combined(fenced, 1) is not None
+
+
+def test_rejects_malformed_replies(app):
+    parse = app.TripPlannerAgent._parse_combined
+    assert parse("Here is your plan!", 2) is None
+    assert parse("[]", 2) is None
+    assert parse(combined_reply(3), 2) is None  # wrong number of days
+    assert parse(combined_reply(2, city_description=""), 2) is None
+    assert parse(combined_reply(2, days=[{"morning": "x", "afternoon": "y"}] * 2), 2) is None
+
+
+def test_formatted_days_match_itinerary_layout(app):
+    days = [{"day": 1, "morning": "Museum", "afternoon": "Walk", "evening": "Dinner"}]
+    assert app.TripPlannerAgent.format_itinerary_days(days) == (
+        "**Day 1:**\n- Morning: Museum\n- Afternoon: Walk\n- Evening: Dinner\n\n"
+    )
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+
+class HungModel:
+    """Gemini stand-in whose calls hang until the test ends, then fail"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self.release.wait(30)
+        raise RuntimeError("released")
+
+
+class BrokenStreamModel:
+    """Gemini stand-in whose streams fail after the first chunk"""
+
+    class Chunk:
+        def __init__(self, text):
+            self.text = text
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        if not stream:
+            raise RuntimeError("unavailable")
+        return self.chunks()
+
+    def chunks(self):
+        yield self.Chunk("**Day 1:**\n- Morning: Lou")
+        raise ConnectionError("stream reset")
+
+
+@pytest.fixture
+def weather(stubs):
+    server = stubs.StubOpenWeather(stubs.LatencyModel(0)).start()
+    yield server
+    server.stop()
+
+
+def hung_agent(app, weather, parallel: bool, deadline: float = 1):
+    """An agent with fresh caches, a short deadline and a Gemini that never answers in time"""
+    agent = app.TripPlannerAgent(
+        "", "test", parallel=parallel, deadline=deadline, weather_base_url=weather.url,
+        geo_cache=app.GeoCache(":memory:"), weather_cache=app.WeatherCache(), llm_cache=app.LLMCache(":memory:"),
+        single_flight=app.SingleFlight(), gemini_limiter=app.UpstreamLimiter("test_gemini", 0),
+        plan_warehouse=app.PlanWarehouse(":memory:")
+    )
+    agent.model = HungModel()
+    return agent
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_plan_trip_stream_falls_back_when_gemini_misses_deadline(app, weather, parallel):
+    agent = hung_agent(app, weather, parallel)
+    try:
+        started = time.monotonic()
+        events = list(agent.plan_trip_stream("Paris", 3, "May"))
+        elapsed = time.monotonic() - started
+    finally:
+        agent.model.release.set()
+
+    assert elapsed < 2.5
+    section, plan = events[-1]
+    assert section == "done"
+    assert set(plan.degraded) == {"city_description", "trip_plan"}
+    assert plan.weather.available and plan.flights and plan.hotels
+    assert plan.city_description == agent.fallback_section("city_description", "Paris", 3)
+    assert plan.trip_plan == agent.fallback_section("trip_plan", "Paris", 3, plan.places)
+    assert ("trip_plan", plan.trip_plan) in events
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_plan_trip_falls_back_when_gemini_misses_deadline(app, weather, parallel):
+    agent = hung_agent(app, weather, parallel)
+    try:
+        started = time.monotonic()
+        plan = agent.plan_trip("Paris", 3, "May")
+        elapsed = time.monotonic() - started
+    finally:
+        agent.model.release.set()
+
+    assert elapsed < 2.5
+    assert set(plan.degraded) == {"city_description", "trip_plan"}
+    assert plan.trip_plan == agent.fallback_section("trip_plan", "Paris", 3, plan.places)
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_plan_trip_stream_flags_a_stream_that_fails_midway(app, weather, parallel):
+    agent = hung_agent(app, weather, parallel, deadline=0)
+    agent.model = BrokenStreamModel()
+    events = list(agent.plan_trip_stream("Paris", 3, "May"))
+
+    section, plan = events[-1]
+    assert section == "done"
+    assert set(plan.degraded) == {"city_description", "trip_plan"}
+    assert plan.trip_plan == "**Day 1:**\n- Morning: Lou" + app.STREAM_INTERRUPTED_TEXT
+    assert ("trip_plan", app.STREAM_INTERRUPTED_TEXT) in events
+
+
+def test_budget_stages_get_their_share_of_the_deadline(app):
+    budget = app.PlanBudget(10, {"weather": 0.5, "trip_plan": 1.0})
+    assert 4.5 < budget.remaining("weather") <= 5
+    assert 9.5 < budget.remaining("trip_plan") <= 10
+    assert app.PlanBudget(0).remaining("weather") is None
+    assert not app.PlanBudget(None).expired("trip_plan")
+
+
+def test_service_deadline_leaves_time_for_whole_gemini_responses(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(app, "run_service", lambda *args: calls.append(args))
+    app.cli(["serve"])
+    app.cli(["serve", "--deadline", "0"])
+
+    assert calls[0][-1] == app.SERVICE_PLAN_DEADLINE > app.GEMINI_TIMEOUT
+    assert app.SERVICE_PLAN_DEADLINE < app.SERVICE_TIMEOUT[1]
+    assert calls[1][-1] == 0
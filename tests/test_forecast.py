@@ -0,0 +1,36 @@
+def entry(dt: int, temp: float, condition: str = "Clear", rain: float = 0.0):
+    return {"dt": dt, "main": {"temp": temp, "temp_min": temp - 1, "temp_max": temp + 1},
+            "weather": [{"main": condition}], **({"rain": {"3h": rain}} if rain else {})}
+
+
+DAY = 86400
+
+
+def test_groups_three_hourly_entries_by_local_day(app):
+    forecast = {"city": {"timezone": 0}, "list": [
+        entry(0, 10), entry(3 * 3600, 14, "Rain", 1.25), entry(6 * 3600, 12, "Rain", 0.5),
+        entry(DAY, 20), entry(DAY + 3 * 3600, 22),
+    ]}
+    first, second = app.aggregate_forecast(forecast)
+    assert first == app.DailyForecast("1970-01-01", 9.0, 15.0, 12.0, 1.8, "Rain")
+    assert second == app.DailyForecast("1970-01-02", 19.0, 23.0, 21.0, 0.0, "Clear")
+
+
+def test_timezone_offset_moves_entries_to_local_day(app):
+    # 23:00 UTC is already the next day at UTC+2
+    forecast = {"city": {"timezone": 7200}, "list": [entry(23 * 3600, 10), entry(DAY + 3600, 12)]}
+    days = app.aggregate_forecast(forecast)
+    assert [day.date for day in days] == ["1970-01-02"]
+
+
+def test_empty_forecast(app):
+    assert app.aggregate_forecast({}) == []
+
+
+def test_climatology_summary(app):
+    climatology = app.Climatology(["Paris"], app.np.array([[[7.0, 2.0, 50.0]] * 12], dtype=app.np.float32))
+    summary = climatology.summary("Paris", "January")
+    assert summary["avg_high_c"] == 7.0 and summary["avg_low_c"] == 2.0 and summary["precipitation_mm"] == 50
+    assert summary["summary"] == app.describe_climate(7.0, 2.0, 50.0)
+    assert climatology.summary("Atlantis", "January") is None
+    assert climatology.summary("Paris", "Smarch") is None
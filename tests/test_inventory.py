@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+
+@pytest.fixture
+def inventory(app):
+    flights = [
+        {"destination": "Paris", "airline": "Air France", "departure": "DEL", "arrival": "CDG",
+         "duration": "9h 5m", "price": "₹41,200", "stops": "Non-stop"},
+        {"destination": "Paris", "airline": "Emirates", "departure": "BOM", "arrival": "CDG",
+         "duration": "12h 40m", "price": "₹32,500", "stops": "1 stop"},
+        {"destination": "Paris", "airline": "Lufthansa", "departure": "DEL", "arrival": "CDG",
+         "duration": "11h", "price": "₹35,900", "stops": "1 stop"},
+        {"destination": "Rome", "airline": "ITA Airways", "departure": "DEL", "arrival": "FCO",
+         "duration": "8h 30m", "price": 29800, "stops": 0},
+    ]
+    hotels = [
+        {"city": "Paris", "name": "Le Petit", "rating": 4.1, "price_per_night": "₹9,800", "amenities": ["WiFi"]},
+        {"city": "Paris", "name": "Le Grand", "rating": 4.8, "price_per_night": "₹24,000",
+         "amenities": ["WiFi", "Spa", "Pool"]},
+        {"city": "Paris", "name": "Le Milieu", "rating": 4.5, "price_per_night": "₹15,500",
+         "amenities": ["WiFi", "Breakfast"]},
+    ]
+    return app.LocalInventory.from_offers(flights, hotels)
+
+
+def test_flights_cheapest_first_and_filtered(inventory):
+    assert [f.airline for f in inventory.search_flights("Paris")] == ["Emirates", "Lufthansa", "Air France"]
+    assert [f.airline for f in inventory.search_flights("paris", max_stops=0)] == ["Air France"]
+    assert [f.airline for f in inventory.search_flights("Paris", origin="DEL", max_price=40000)] == ["Lufthansa"]
+    assert [f.airline for f in inventory.search_flights("Paris", sort="duration", limit=1)] == ["Air France"]
+    assert inventory.search_flights("Paris", airlines=["Qantas"]) == []
+
+
+def test_hotels_by_rating_and_amenities(inventory):
+    assert [h.name for h in inventory.search_hotels("Paris", sort="rating")] == ["Le Grand", "Le Milieu", "Le Petit"]
+    assert [h.name for h in inventory.search_hotels("Paris", amenities=["WiFi", "Spa"])] == ["Le Grand"]
+    assert [h.name for h in inventory.search_hotels("Paris", min_rating=4.5, max_price=20000)] == ["Le Milieu"]
+    assert inventory.search_hotels("Paris", amenities=["Helipad"]) == []
+    grand = inventory.search_hotels("Paris", sort="rating", limit=1)[0]
+    assert (grand.rating, grand.price_per_night, grand.amenities) == (4.8, 24000, ("WiFi", "Spa", "Pool"))
+
+
+def test_unknown_sort_is_rejected(inventory):
+    with pytest.raises(ValueError):
+        inventory.search_flights("Paris", sort="rating")
+
+
+def test_unknown_destination_uses_the_fallback_provider(app):
+    shipped = app.LocalInventory.load()
+    hotels = shipped.search_hotels("Kyoto", sort="rating")
+    assert hotels and all("Kyoto" in hotel.name for hotel in hotels)
+    assert {flight.arrival for flight in shipped.search_flights("Kyoto")} == {"KYO"}
+    bare = app.LocalInventory.from_offers([], [])
+    assert bare.search_flights("Kyoto") == [] and bare.search_hotels("Kyoto") == []
+
+
+def test_top_k_matches_a_full_sort(app):
+    rng = random.Random(7)
+    offers = [{"city": "Paris", "name": f"H{i}", "rating": rng.randint(30, 50) / 10,
+               "price_per_night": rng.randrange(1000, 30000, 100), "amenities": []} for i in range(300)]
+    inventory = app.LocalInventory.from_offers([], offers)
+    expected = sorted(offers, key=lambda h: (-h["rating"], h["price_per_night"]))[:10]
+    found = inventory.search_hotels("Paris", sort="rating", limit=10)
+    assert [(h.rating, h.price_per_night) for h in found] == [(h["rating"], h["price_per_night"]) for h in expected]
+
+
+def test_parsers(app):
+    assert app.parse_price("₹18,500") == 18500 and app.parse_price("18500.00 INR") == 18500
+    assert app.parse_duration("6h 45m") == 405 and app.parse_duration("50m") == 50
+    assert app.parse_stops("Non-stop") == 0 and app.parse_stops("2 stops") == 2
+    with pytest.raises(ValueError):
+        app.parse_duration("soon")
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+
+def test_limiter_rejects_when_queue_is_full(app, wait_until):
+    limiter = app.UpstreamLimiter("test_queue", rpm=0, max_concurrency=1, max_queue=1, max_wait=5)
+    limiter.acquire()
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(limiter.acquire()))
+    waiter.start()
+    wait_until(lambda: limiter._waiting == 1)
+
+    with pytest.raises(app.RateLimitExceeded, match="queue is full"):
+        limiter.acquire()
+
+    limiter.release()
+    waiter.join(5)
+    assert len(waited) == 1
+    limiter.release()
+
+
+def test_limiter_rejects_past_deadline_without_waiting_it_out(app):
+    limiter = app.UpstreamLimiter("test_deadline", rpm=1, max_concurrency=4)
+    limiter.acquire()
+    limiter.release()
+
+    # The next request token is a minute away, so a 2 s deadline can't be met
+    started = time.monotonic()
+    with pytest.raises(app.RateLimitExceeded, match="no quota"):
+        limiter.acquire(timeout=2)
+    assert time.monotonic() - started < 0.5
+
+
+def test_limiter_rejects_when_slots_stay_busy_past_deadline(app):
+    limiter = app.UpstreamLimiter("test_busy", rpm=0, max_concurrency=1)
+    limiter.acquire()
+    with pytest.raises(app.RateLimitExceeded):
+        limiter.acquire(timeout=0.05)
+    limiter.release()
+
+
+def test_limiter_halves_concurrency_on_throttle_and_recovers(app):
+    limiter = app.UpstreamLimiter("test_aimd", rpm=0, max_concurrency=8)
+    with limiter.slot() as outcome:
+        outcome["throttled"] = True
+    assert limiter.limit == 4
+    for _ in range(20):
+        with limiter.slot():
+            pass
+    assert 4 < limiter.limit <= 8
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def plan(app):
+    weather = app.WeatherSummary(21.4, 20.9, 58, "Clouds", "scattered clouds",
+                                 [app.DailyForecast("2026-05-01", 17.0, 23.0, 20.1, 0.8, "Rain")])
+    return app.TripPlan(
+        city_description="Paris is…", weather=weather, climate={"month": "May", "avg_high_c": 20.0},
+        places=[app.Place("Louvre", "museum", 4.7, 48.861, 2.336)],
+        flights=[app.Flight("Air France", "DEL", "CDG", 545, 41200, 0)],
+        hotels=[app.Hotel("Hôtel du Nord", 4.4, 12500, ["WiFi", "Breakfast"])],
+        trip_plan="**Day 1:**", itinerary_days=[{"day": 1, "morning": "Louvre"}],
+        duration=3, month="May", degraded=["weather"]
+    )
+
+
+def test_pack_round_trip(app, plan):
+    assert app.TripPlan.unpack(plan.pack()) == plan
+
+
+def test_dict_round_trip_through_json(app, plan):
+    assert app.TripPlan.from_dict(json.loads(json.dumps(plan.to_dict()))) == plan
+
+
+def test_unpack_rejects_other_formats(app, plan):
+    with pytest.raises(ValueError, match="format"):
+        app.TripPlan.unpack(app.marshal.dumps((app.PLAN_FORMAT_VERSION + 1, plan.to_tuple())))
+    with pytest.raises(ValueError):
+        app.TripPlan.unpack(b"not a plan")
+
+
+def test_replace_and_labels(app, plan):
+    updated = plan.replace(month="June")
+    assert updated.month == "June" and plan.month == "May"
+    flight = plan.flights[0]
+    assert (flight.duration_label, flight.price_label, flight.stops_label) == ("9h 5m", "₹41,200", "Non-stop")
+    assert app.Flight("X", "A", "B", 60, 100, 2).stops_label == "2 stops"
+    assert not app.WeatherSummary.unavailable("down").available
@@ -0,0 +1,34 @@
+from collections import Counter
+
+
+def test_every_place_is_scheduled_once_with_even_days(app):
+    places = [app.Place(f"P{i}", "museum", 4.5, 48.85 + (i % 4) * 0.01, 2.35 + (i // 4) * 0.01) for i in range(10)]
+    days = app.schedule_itinerary(places, 3)
+    assert len(days) == 3
+    assert sorted(len(day) for day in days) == [3, 3, 4]
+    assert Counter(place.name for day in days for place in day) == Counter(place.name for place in places)
+
+
+def test_days_group_nearby_places(app):
+    # Two tight clusters far apart: each day should stay within one of them
+    paris = [app.Place(f"Paris {i}", "museum", 4.5, 48.85 + i * 0.001, 2.35) for i in range(3)]
+    lyon = [app.Place(f"Lyon {i}", "museum", 4.5, 45.76 + i * 0.001, 4.83) for i in range(3)]
+    days = app.schedule_itinerary(paris[:2] + lyon + paris[2:], 2)
+    assert sorted(" ".join({place.name.split()[0] for place in day}) for day in days) == ["Lyon", "Paris"]
+
+
+def test_places_without_coordinates_keep_list_order(app):
+    places = [app.Place(f"P{i}", "museum", 4.5) for i in range(5)]
+    assert app.schedule_itinerary(places, 2) == [places[:3], places[3:]]
+
+
+def test_no_days_or_no_places(app):
+    assert app.schedule_itinerary([app.Place("P", "museum", 4.5)], 0) == []
+    assert app.schedule_itinerary([], 2) == [[], []]
+
+
+def test_haversine_matrix_known_distance(app):
+    # Paris to London is about 344 km
+    distances = app.haversine_matrix(app.np.array([48.8566, 51.5074]), app.np.array([2.3522, -0.1278]))
+    assert abs(distances[0, 1] - 344) < 2
+    assert distances[0, 0] == 0 and distances[0, 1] == distances[1, 0]
@@ -0,0 +1,100 @@
+import threading
+
+
+def track_followers(flights) -> threading.Event:
+    """Event set once a caller joins an existing flight instead of leading its own"""
+    joined = threading.Event()
+    join = flights._join
+
+    def tracked(key):
+        flight, leader = join(key)
+        if not leader:
+            joined.set()
+        return flight, leader
+
+    flights._join = tracked
+    return joined
+
+
+def test_single_flight_follower_gets_leader_error(app):
+    flights = app.SingleFlight()
+    joined = track_followers(flights)
+    started, release = threading.Event(), threading.Event()
+    calls, errors = [], []
+
+    def fail():
+        calls.append(threading.current_thread().name)
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    def call():
+        try:
+            flights.do(("gemini", "prompt"), fail)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    assert joined.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert len(errors) == 2 and errors[0] is errors[1]
+    # The failed flight is forgotten, so the next caller tries again
+    assert flights.do(("gemini", "prompt"), lambda: "ok") == "ok"
+
+
+def test_single_flight_stream_replays_chunks_to_late_follower(app):
+    flights = app.SingleFlight()
+    joined = track_followers(flights)
+    gate = threading.Event()
+    starts = []
+
+    def source():
+        starts.append(1)
+        yield "a"
+        yield "b"
+        gate.wait(5)
+        yield "c"
+
+    leader = flights.stream(("gemini_stream", "prompt"), source)
+    assert [next(leader), next(leader)] == ["a", "b"]
+    received = []
+    follower = threading.Thread(target=lambda: received.extend(flights.stream(("gemini_stream", "prompt"), source)))
+    follower.start()
+    assert joined.wait(5)
+    gate.set()
+    assert list(leader) == ["c"]
+    follower.join(5)
+
+    assert received == ["a", "b", "c"]
+    assert len(starts) == 1
+
+
+def test_single_flight_shares_one_result_among_concurrent_callers(app):
+    flights = app.SingleFlight()
+    joined = track_followers(flights)
+    release = threading.Event()
+    calls, results = [], []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"temp": 21}
+
+    threads = [threading.Thread(target=lambda: results.append(flights.do(("weather", 1), fetch))) for _ in range(2)]
+    threads[0].start()
+    threads[1].start()
+    assert joined.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results[0] is results[1]
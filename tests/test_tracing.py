@@ -0,0 +1,20 @@
+import importlib.util
+
+
+def rerun(stubs):
+    """A second copy of the app module, the way Streamlit re-executes the script on each rerun"""
+    spec = importlib.util.spec_from_file_location("trip_planner_rerun", stubs.APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_spans_from_an_earlier_run_reach_the_current_trace(app, stubs):
+    current = rerun(stubs)
+    assert current.METRICS is app.METRICS
+
+    with current.start_trace("request") as trace:
+        with app.span("gemini"):
+            pass
+
+    assert [span["span"] for span in trace.waterfall()] == ["gemini"]
@@ -0,0 +1,36 @@
+import threading
+import time
+
+
+def test_stale_entry_is_served_while_one_background_refresh_runs(app, wait_until):
+    cache = app.WeatherCache(ttls={"current": 0.05}, max_stale=60)
+    assert cache.get("current", 48.85, 2.35, lambda: {"temp": 1}) == {"temp": 1}
+    time.sleep(0.1)
+
+    release = threading.Event()
+    refreshes = []
+
+    def slow_fetch():
+        refreshes.append(1)
+        release.wait(5)
+        return {"temp": 2}
+
+    # Stale reads are served at once while a single refresh runs behind them
+    for _ in range(5):
+        assert cache.get("current", 48.85, 2.35, slow_fetch) == {"temp": 1}
+    release.set()
+    wait_until(lambda: cache.get("current", 48.85, 2.35, slow_fetch) == {"temp": 2})
+    assert len(refreshes) == 1
+
+
+def test_entry_past_max_stale_is_fetched_again(app):
+    cache = app.WeatherCache(ttls={"current": 0.01}, max_stale=0.01)
+    cache.get("current", 48.85, 2.35, lambda: {"temp": 1})
+    time.sleep(0.05)
+    assert cache.get("current", 48.85, 2.35, lambda: {"temp": 2}) == {"temp": 2}
+
+
+def test_nearby_coordinates_share_an_entry(app):
+    cache = app.WeatherCache()
+    cache.get("current", 48.851, 2.351, lambda: {"temp": 1})
+    assert cache.get("current", 48.849, 2.349, lambda: {"temp": 2}) == {"temp": 1}